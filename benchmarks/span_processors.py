@@ -0,0 +1,111 @@
+#
+# This file is part of the Ingram Micro CloudBlue RnD Integration Connectors SDK.
+#
+# Copyright (c) 2023 Ingram Micro. All Rights Reserved.
+#
+"""
+Multi-threaded throughput benchmark of the stock BatchSpanProcessor against the
+ShardedBatchSpanProcessor: worker threads creating short technical spans, with the load
+spread evenly over N threads, on a single thread or skewed to one busy thread out of N.
+
+    python benchmarks/span_processors.py --threads 32 --spans 5000 --export-delay-ms 200
+"""
+import argparse
+import typing
+from threading import Barrier, Thread
+from time import perf_counter, sleep
+
+from opentelemetry.sdk.trace import ReadableSpan, sampling, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+from rndi.telemetry.processors.sharded import ShardedBatchSpanProcessor
+
+
+class CountingSpanExporter(SpanExporter):
+    def __init__(self, delay_seconds: float = 0):
+        self.exported = 0
+        self.delay_seconds = delay_seconds
+
+    def export(self, spans: typing.Sequence[ReadableSpan]) -> SpanExportResult:
+        if self.delay_seconds:
+            sleep(self.delay_seconds)
+        self.exported += len(spans)
+        return SpanExportResult.SUCCESS
+
+
+def scenarios(threads: int, spans: int) -> typing.Dict[str, typing.List[int]]:
+    """
+    The spans created by each thread in each scenario, all of them create the same total.
+    """
+    total = threads * spans
+    skewed = [total // 2] + [total // 2 // (threads - 1)] * (threads - 1) if threads > 1 else [total]
+    return {
+        'even': [spans] * threads,
+        'single': [total],
+        'skewed': skewed,
+    }
+
+
+def run(processor_factory, loads: typing.List[int], delay_seconds: float = 0) -> typing.Tuple[float, int]:
+    exporter = CountingSpanExporter(delay_seconds)
+    processor = processor_factory(exporter)
+    provider = TracerProvider(sampler=sampling.ALWAYS_ON)
+    provider.add_span_processor(processor)
+    tracer = provider.get_tracer('benchmark')
+    barrier = Barrier(len(loads) + 1)
+
+    def _work(spans: int):
+        barrier.wait()
+        for _ in range(spans):
+            with tracer.start_as_current_span('technical-transaction'):
+                pass
+
+    workers = [Thread(target=_work, args=(spans,)) for spans in loads]
+    for worker in workers:
+        worker.start()
+
+    barrier.wait()
+    started = perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = perf_counter() - started
+    provider.shutdown()
+
+    return sum(loads) / elapsed, exporter.exported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--spans', type=int, default=5000, help='spans per thread')
+    parser.add_argument('--max-queue-size', type=int, default=2048)
+    parser.add_argument('--max-export-batch-size', type=int, default=512)
+    parser.add_argument('--shards', type=int, default=16)
+    parser.add_argument('--export-delay-ms', type=float, default=0, help='time taken by each export')
+    parser.add_argument('--scenario', choices=('even', 'single', 'skewed'), action='append')
+    args = parser.parse_args()
+
+    processors = {
+        'BatchSpanProcessor': lambda exporter: BatchSpanProcessor(
+            exporter,
+            max_queue_size=args.max_queue_size,
+            max_export_batch_size=args.max_export_batch_size,
+        ),
+        'ShardedBatchSpanProcessor': lambda exporter: ShardedBatchSpanProcessor(
+            exporter,
+            max_queue_size=args.max_queue_size,
+            max_export_batch_size=args.max_export_batch_size,
+            shards=args.shards,
+        ),
+    }
+
+    loads = scenarios(args.threads, args.spans)
+    for scenario in args.scenario or list(loads):
+        total = sum(loads[scenario])
+        print(f"{scenario}: {len(loads[scenario])} threads, {total} spans")
+        for name, factory in processors.items():
+            throughput, exported = run(factory, loads[scenario], args.export_delay_ms / 1000)
+            print(f"  {name:<28} {throughput:>12,.0f} spans/s  exported {exported}/{total}")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,19 +4,39 @@
 # Copyright (c) 2023 Ingram Micro. All Rights Reserved.
 #
 import hashlib
+import signal
+import sys
 from contextlib import contextmanager
-from typing import Any, Callable, Dict, Iterator, List, Optional
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, Iterator, List, MutableMapping, Optional, Tuple
 
 from azure.monitor.opentelemetry.exporter import AzureMonitorTraceExporter
 from opentelemetry import trace
+from opentelemetry.context import Context
 from opentelemetry.sdk.resources import Resource
-from opentelemetry.sdk.trace import sampling, Tracer, TracerProvider
+from opentelemetry.sdk.trace import sampling, SpanLimits, SpanProcessor, Tracer, TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter
-from opentelemetry.trace import NonRecordingSpan, Span, SpanContext
+from opentelemetry.trace import Link, NonRecordingSpan, Span, SpanContext
 from pkg_resources import DistributionNotFound, get_distribution
 from rndi.connect.business_objects.adapters import Request
 from rndi.telemetry.adapters.null import DummySpan
+from rndi.telemetry.config import get_flag, get_list, get_mapping, get_number
 from rndi.telemetry.contracts import Observer
+from rndi.telemetry.processors.budget import SpanBudgetSpanProcessor
+from rndi.telemetry.processors.coalescing import CoalescingSpanProcessor
+from rndi.telemetry.processors.http import (
+    compile_url_templates,
+    DEFAULT_LATENCY_BUCKETS_MS,
+    HttpAggregatingSpanProcessor,
+)
+from rndi.telemetry.processors.recorder import FlightRecorderSpanProcessor, install_dump_signal_handler
+from rndi.telemetry.processors.sharded import ShardedBatchSpanProcessor
+from rndi.telemetry.profiling import attach_profile, DEFAULT_PROFILE_MAX_BYTES, SlowTransactionProfiler
+from rndi.telemetry.propagation import extract_context, find_carrier, inject_context
+from rndi.telemetry.stats import MeasuredSpanProcessor, ObserverStats
+
+# the SDK keeps 128 links of each span by default, and the Azure exporter sends about 100 of them.
+MAX_BATCH_LINKS = 100
 
 
 def generate_trace_id(request_id: str, length: int = 16):
@@ -32,6 +52,14 @@ def generate_trace_id(request_id: str, length: int = 16):
     return int.from_bytes(hash_object.digest()[:length], byteorder='big')
 
 
+def intern_id(value: Any) -> Any:
+    """
+    Intern the repeated identifiers (vendor, product, marketplace...) so all the queued spans
+    share one copy of each value instead of one per parsed request.
+    """
+    return sys.intern(value) if isinstance(value, str) else value
+
+
 def hydrate_span_with_product_action_attributes(span: Span, body):
     """
     Given a Product Action Body, hydrate the span attributes with the body of this action.
@@ -72,27 +100,27 @@ def hydrate_span_with_request_attributes(span, request: dict):
         request = Request(request)
         if request.is_asset_request():
             span.set_attributes({
-                'vendor_id': request.asset().connection('vendor', {}).get('id'),
-                'product_id': request.asset().product('id'),
-                'marketplace_id': request.asset().marketplace('id'),
-                'contract_id': request.asset().contract('id'),
-                'connection_id': request.asset().connection('id'),
+                'vendor_id': intern_id(request.asset().connection('vendor', {}).get('id')),
+                'product_id': intern_id(request.asset().product('id')),
+                'marketplace_id': intern_id(request.asset().marketplace('id')),
+                'contract_id': intern_id(request.asset().contract('id')),
+                'connection_id': intern_id(request.asset().connection('id')),
                 'asset_id': request.asset().id(),
                 'request_id': request.id(),
-                'request_status': request.status(),
-                'request_type': request.type(),
+                'request_status': intern_id(request.status()),
+                'request_type': intern_id(request.type()),
             })
 
         if request.is_tier_config_request():
             span.set_attributes({
-                'vendor_id': request.tier_configuration().connection('vendor', {}).get('id'),
-                'product_id': request.tier_configuration().product('id'),
-                'marketplace_id': request.tier_configuration().marketplace('id'),
-                'connection_id': request.tier_configuration().connection('id'),
+                'vendor_id': intern_id(request.tier_configuration().connection('vendor', {}).get('id')),
+                'product_id': intern_id(request.tier_configuration().product('id')),
+                'marketplace_id': intern_id(request.tier_configuration().marketplace('id')),
+                'connection_id': intern_id(request.tier_configuration().connection('id')),
                 'tier_config_id': request.tier_configuration().id(),
                 'request_id': request.id(),
-                'request_status': request.status(),
-                'request_type': request.type(),
+                'request_status': intern_id(request.status()),
+                'request_type': intern_id(request.type()),
             })
     except Exception:
         """We don't want to break the execution at any cost"""
@@ -108,6 +136,63 @@ def get_context(request_id: str):
         )))
 
 
+def provide_span_limits(config: dict) -> SpanLimits:
+    """
+    Provide the span limits of the tracer provider from the config, the limits that are not
+    provided fall back to the OpenTelemetry defaults (and OTEL_* environment variables).
+    :param config: The configuration dictionary.
+    :return: SpanLimits
+    """
+    return SpanLimits(
+        max_span_attributes=get_number(config, 'TELEMETRY_SPAN_ATTRIBUTE_COUNT_LIMIT'),
+        max_span_attribute_length=get_number(config, 'TELEMETRY_SPAN_ATTRIBUTE_VALUE_LENGTH_LIMIT'),
+        max_events=get_number(config, 'TELEMETRY_SPAN_EVENT_COUNT_LIMIT'),
+        max_links=get_number(config, 'TELEMETRY_SPAN_LINK_COUNT_LIMIT'),
+    )
+
+
+def provide_span_processor(config: dict, exporter: SpanExporter, counters: ObserverStats) -> SpanProcessor:
+    """
+    Provide the chain of span processors exporting the spans. The byte budget is applied right
+    before the spans are queued, so the summary spans built by the coalescing and aggregating
+    processors are trimmed too.
+    :param config: The configuration dictionary.
+    :param exporter: The span exporter.
+    :param counters: The observer stats.
+    :return: SpanProcessor
+    """
+    if get_flag(config, 'TELEMETRY_SHARDED_SPAN_PROCESSOR'):
+        span_processor = ShardedBatchSpanProcessor(exporter)
+    else:
+        span_processor = BatchSpanProcessor(exporter)
+
+    max_span_bytes = get_number(config, 'TELEMETRY_SPAN_BYTES_LIMIT')
+    if max_span_bytes is not None or counters.enabled:
+        span_processor = SpanBudgetSpanProcessor(span_processor, max_span_bytes, counters)
+
+    if get_flag(config, 'TELEMETRY_PGSQL_COALESCING'):
+        span_processor = CoalescingSpanProcessor(span_processor)
+
+    if get_flag(config, 'TELEMETRY_REQUESTS_AGGREGATION'):
+        templates = get_mapping(config, 'TELEMETRY_REQUESTS_URL_TEMPLATES')
+        span_processor = HttpAggregatingSpanProcessor(
+            span_processor,
+            templates=None if templates is None else compile_url_templates(templates),
+            outlier_threshold_ms=get_number(config, 'TELEMETRY_REQUESTS_OUTLIER_THRESHOLD_MS', 1000, float),
+            latency_buckets_ms=get_list(
+                config,
+                'TELEMETRY_REQUESTS_LATENCY_BUCKETS_MS',
+                list(DEFAULT_LATENCY_BUCKETS_MS),
+                float,
+            ),
+        )
+
+    if counters.enabled:
+        span_processor = MeasuredSpanProcessor(span_processor, counters)
+
+    return span_processor
+
+
 def provide_azure_insights_observer_telemetry_adapter(
         config: dict,
         automatic_instrumentation: List[Callable[[], None]],
@@ -116,6 +201,7 @@ def provide_azure_insights_observer_telemetry_adapter(
     try:
         tracer_provider = TracerProvider(
             sampler=sampling.ALWAYS_ON,
+            span_limits=provide_span_limits(config),
             resource=Resource.create({
                 "service.name": config.get('TELEMETRY_SERVICE_NAME'),
                 "service.version": get_distribution(config.get('TELEMETRY_SERVICE_NAME')).version,
@@ -126,6 +212,7 @@ def provide_azure_insights_observer_telemetry_adapter(
     except DistributionNotFound:
         tracer_provider = TracerProvider(
             sampler=sampling.ALWAYS_ON,
+            span_limits=provide_span_limits(config),
             resource=Resource.create({
                 "service.name": config.get('TELEMETRY_SERVICE_NAME'),
                 "service.version": config.get('TELEMETRY_SERVICE_VERSION'),
@@ -140,16 +227,70 @@ def provide_azure_insights_observer_telemetry_adapter(
         )
 
     trace.set_tracer_provider(tracer_provider)
-    span_processor = BatchSpanProcessor(exporter)
-    tracer_provider.add_span_processor(span_processor)
+    counters = ObserverStats(enabled=get_flag(config, 'TELEMETRY_STATS'))
+    tracer_provider.add_span_processor(provide_span_processor(config, exporter, counters))
+
+    flight_recorder = None
+    if get_flag(config, 'TELEMETRY_FLIGHT_RECORDER'):
+        flight_recorder = FlightRecorderSpanProcessor(
+            capacity=get_number(config, 'TELEMETRY_FLIGHT_RECORDER_CAPACITY', 2048),
+            window_seconds=get_number(config, 'TELEMETRY_FLIGHT_RECORDER_WINDOW_SECONDS', 300, float),
+            path=config.get('TELEMETRY_FLIGHT_RECORDER_PATH'),
+            max_bytes=get_number(config, 'TELEMETRY_FLIGHT_RECORDER_MAX_BYTES', 8 * 1024 * 1024),
+            min_dump_interval_seconds=get_number(
+                config,
+                'TELEMETRY_FLIGHT_RECORDER_MIN_DUMP_INTERVAL_SECONDS',
+                60,
+                float,
+            ),
+        )
+        max_span_bytes = get_number(config, 'TELEMETRY_SPAN_BYTES_LIMIT')
+        tracer_provider.add_span_processor(
+            flight_recorder if max_span_bytes is None else SpanBudgetSpanProcessor(flight_recorder, max_span_bytes),
+        )
+        signal_name = config.get('TELEMETRY_FLIGHT_RECORDER_SIGNAL', 'SIGUSR1')
+        signum = signal.Signals.__members__.get(str(signal_name).upper()) if signal_name else None
+        if signum is not None:
+            install_dump_signal_handler(flight_recorder, signum)
+
+    profiler = None
+    if config.get('TELEMETRY_PROFILER_THRESHOLD_MS') is not None:
+        profiler = SlowTransactionProfiler(
+            threshold_ms=get_number(config, 'TELEMETRY_PROFILER_THRESHOLD_MS', 1000, float),
+            interval_ms=get_number(config, 'TELEMETRY_PROFILER_INTERVAL_MS', 10, float),
+            max_bytes=provide_profile_max_bytes(config),
+        )
 
     return DevOpsExtensionAzureInsightsObserverAdapter(
         connection_string=config.get('INSIGHTS_CONNECTION_STRING'),
         automatic_instrumentation=automatic_instrumentation,
         tracer=trace.get_tracer('TELEMETRY_SERVICE_NAME'),
+        flight_recorder=flight_recorder,
+        profiler=profiler,
+        counters=counters,
     )
 
 
+def provide_profile_max_bytes(config: dict) -> int:
+    """
+    Provide the maximum length of the encoded profiles, so they are never truncated by the
+    span attribute value length limit nor by the span byte budget.
+    :param config: The configuration dictionary.
+    :return: int
+    """
+    limits = [get_number(config, 'TELEMETRY_PROFILER_MAX_BYTES', DEFAULT_PROFILE_MAX_BYTES)]
+    max_span_attribute_length = get_number(config, 'TELEMETRY_SPAN_ATTRIBUTE_VALUE_LENGTH_LIMIT')
+    if max_span_attribute_length is not None:
+        limits.append(max_span_attribute_length)
+
+    max_span_bytes = get_number(config, 'TELEMETRY_SPAN_BYTES_LIMIT')
+    if max_span_bytes is not None:
+        # the rest of the span shares the budget with the profile.
+        limits.append(max_span_bytes // 2)
+
+    return min(limits)
+
+
 def get_transaction_id_for_product_action(request: dict):
     """
     Get the transaction id for a product action
@@ -191,22 +332,93 @@ def is_custom_event_request(request: dict):
     return request.get('body') is not None
 
 
+def classify_request(request: dict) -> Optional[Tuple[str, Optional[Callable[[Span, dict], None]]]]:
+    """
+    Classify the request of a Business Transaction, returning the transaction id used to
+    derive the trace context and the function to hydrate the span attributes (if any).
+    If the request format is unknown None is returned.
+    """
+    if is_background_event_request(request):
+        return request.get('id'), hydrate_span_with_request_attributes
+
+    if is_product_action_request(request):
+        return get_transaction_id_for_product_action(request), hydrate_span_with_product_action_attributes
+
+    if is_custom_event_request(request):
+        return request.get('body').__str__(), None
+
+    return None
+
+
+class SpanAttributesCollector:
+    """
+    Collect the attributes set by the hydrate functions before the span exists, so they can
+    be given to the span on its start.
+    """
+    __slots__ = ('attributes',)
+
+    def __init__(self):
+        self.attributes: Dict[str, Any] = {}
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        self.attributes.update(attributes)
+
+
 class DevOpsExtensionAzureInsightsObserverAdapter(Observer):
     def __init__(
             self,
             connection_string: str,
             tracer: Tracer,
             automatic_instrumentation: Optional[List[Callable]] = None,
+            flight_recorder: Optional[FlightRecorderSpanProcessor] = None,
+            profiler: Optional[SlowTransactionProfiler] = None,
+            counters: Optional[ObserverStats] = None,
     ):
         self.tracer = tracer
         self.connection_string = connection_string
-        self.business_transaction: Optional[Span] = None
+        self.flight_recorder = flight_recorder
+        self.profiler = profiler
+        self.counters = ObserverStats() if counters is None else counters
+        self._business_transaction: ContextVar[Optional[Span]] = ContextVar(
+            f"business_transaction_{id(self)}",
+            default=None,
+        )
         if not automatic_instrumentation:
             automatic_instrumentation = []
 
         for instrument in automatic_instrumentation:
             instrument()
 
+    @property
+    def business_transaction(self) -> Optional[Span]:
+        """
+        The running Business Transaction, scoped to the current thread or asyncio task.
+        """
+        return self._business_transaction.get()
+
+    @business_transaction.setter
+    def business_transaction(self, span: Optional[Span]):
+        self._business_transaction.set(span)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return self.counters.snapshot()
+
+    def inject(self, carrier: MutableMapping[str, str]) -> MutableMapping[str, str]:
+        return inject_context(carrier)
+
+    def extract(self, carrier: Dict[str, Any]) -> Optional[Context]:
+        return extract_context(carrier)
+
+    def dump_flight_recorder(self, reason: str = 'manual') -> None:
+        if self.flight_recorder is None:
+            return
+
+        try:
+            self.flight_recorder.request_dump(reason)
+        except Exception:
+            """We don't want to break the execution at any cost"""
+            return
+
     @contextmanager
     def trace(self, name: str, context: Dict[str, Any]) -> Iterator[Span]:
         """
@@ -218,40 +430,162 @@ class DevOpsExtensionAzureInsightsObserverAdapter(Observer):
         context we will just yield None and the observer will not do anything.
         That way we will not cause the side effect of crashing the application, and instead
         we will just lose observability for that runtime execution.
+        If the context carries a W3C trace context (traceparent in the request fields, headers or
+        metadata) the Business Transaction continues that trace, otherwise the trace context is
+        derived from the request identifier.
+        If a Business Transaction fails, the flight recorder (if any) is dumped.
         """
         if self.business_transaction is None:
-            if is_background_event_request(context):
-                with self.tracer.start_as_current_span(
-                        name,
-                        context=get_context(context.get('id')),
-                ) as span:
-                    self.business_transaction = span
-                    hydrate_span_with_request_attributes(span, context)
+            try:
+                with self._trace_business_transaction(name, context) as span:
                     yield span
-                return
+            except Exception:
+                self.dump_flight_recorder('failure')
+                raise
+        else:
+            with self._start_span(name) as span:
+                with self.counters.timed('hydration'):
+                    hydrate_span_with_request_attributes(span, context)
+                yield span
 
-            if is_product_action_request(context):
-                with self.tracer.start_as_current_span(
-                        name,
-                        context=get_context(get_transaction_id_for_product_action(context)),
-                ) as span:
+    @contextmanager
+    def trace_batch(
+            self,
+            name: str,
+            contexts: Iterable[Dict[str, Any]],
+            item_name: Optional[str] = None,
+    ) -> Iterator[Iterator[Tuple[Dict[str, Any], Optional[Span]]]]:
+        """
+        The whole page is classified, and the trace context and the attributes of each item are
+        derived up front. The batch span is a new root linked to the root of each request, the
+        links over MAX_BATCH_LINKS are split over "<name>.links" children of the batch span so
+        none is dropped. Each item span is a Business Transaction in the trace of its own request
+        linked to the batch span. While an item is being iterated, the nested traces are Technical Transactions
+        of that item, the items that are not a known request are not traced, as in trace.
+        If the loop body fails, the error is recorded on the span of the current item and the
+        flight recorder (if any) is dumped.
+        """
+        contexts = list(contexts)
+        plans = [self._plan_business_transaction(context) for context in contexts]
+
+        links = [Link(trace.get_current_span(parent).get_span_context()) for parent, _ in plans if parent is not None]
+
+        attributes = {'batch.size': len(contexts), 'batch.linked': len(links)}
+        with self._start_span(name, Context(), attributes, links[:MAX_BATCH_LINKS]) as span:
+            for start in range(MAX_BATCH_LINKS, len(links), MAX_BATCH_LINKS):
+                with self._start_span(f"{name}.links", None, None, links[start:start + MAX_BATCH_LINKS]):
+                    pass
+
+            items = self._trace_batch_items(item_name or name, span, contexts, plans)
+            try:
+                yield items
+            except Exception as error:
+                try:
+                    items.throw(error)
+                except Exception:
+                    """The error is raised below, once it is recorded on the current item span."""
+                self.dump_flight_recorder('failure')
+                raise
+            finally:
+                items.close()
+
+    def _trace_batch_items(
+            self,
+            name: str,
+            batch: Span,
+            contexts: List[Dict[str, Any]],
+            plans: List[Tuple[Optional[Context], Dict[str, Any]]],
+    ) -> Iterator[Tuple[Dict[str, Any], Optional[Span]]]:
+        previous = self.business_transaction
+        links = [Link(batch.get_span_context())]
+        try:
+            for context, (parent, attributes) in zip(contexts, plans):
+                if parent is None:
+                    yield context, None
+                    continue
+
+                with self._start_span(name, parent, attributes, links) as span:
                     self.business_transaction = span
-                    hydrate_span_with_product_action_attributes(span, context)
-                    yield span
-                return
+                    try:
+                        with self._profile(span):
+                            yield context, span
+                    finally:
+                        self.business_transaction = previous
+        finally:
+            self.business_transaction = previous
+
+    def _plan_business_transaction(self, context: Dict[str, Any]) -> Tuple[Optional[Context], Dict[str, Any]]:
+        """
+        Derive the trace context and the attributes of a Business Transaction before starting it,
+        if the context is not a known request nor carries a trace context, the parent is None.
+        """
+        with self.counters.timed('classification'):
+            classification = classify_request(context)
 
-            if is_custom_event_request(context):
-                with self.tracer.start_as_current_span(
-                        name,
-                        context=get_context(context.get('body').__str__()),
-                ) as span:
-                    self.business_transaction = span
-                    yield span
-                return
+        with self.counters.timed('context'):
+            carrier = find_carrier(context)
+            parent = None if carrier is None else extract_context(carrier)
+            if parent is None and classification is not None:
+                parent = get_context(classification[0])
+
+        collector = SpanAttributesCollector()
+        if parent is not None and classification is not None and classification[1] is not None:
+            with self.counters.timed('hydration'):
+                classification[1](collector, context)
+
+        return parent, collector.attributes
+
+    @contextmanager
+    def _trace_business_transaction(self, name: str, context: Dict[str, Any]) -> Iterator[Span]:
+        parent, attributes = self._plan_business_transaction(context)
+        if parent is None:
             # if no possible option was found, just return a dummy span who will not generate traces.
             with DummySpan() as span:
                 yield span
-        else:
-            with self.tracer.start_as_current_span(name) as span:
-                hydrate_span_with_request_attributes(span, context)
+            return
+
+        with self._start_span(name, parent, attributes) as span:
+            self.business_transaction = span
+            try:
+                with self._profile(span):
+                    yield span
+            finally:
+                self.business_transaction = None
+
+    @contextmanager
+    def _profile(self, span: Span) -> Iterator[None]:
+        if self.profiler is None:
+            yield
+            return
+
+        transaction = self.profiler.start()
+        try:
+            yield
+        finally:
+            attach_profile(
+                span,
+                self.profiler.stop(transaction),
+                self.profiler.interval * 1000,
+                self.profiler.max_bytes,
+            )
+
+    @contextmanager
+    def _start_span(
+            self,
+            name: str,
+            parent: Optional[Context] = None,
+            attributes: Optional[Dict[str, Any]] = None,
+            links: Optional[List[Link]] = None,
+    ) -> Iterator[Span]:
+        """
+        Same as Tracer.start_as_current_span but measuring the start and the end of the span.
+        """
+        with self.counters.timed('span.start'):
+            span = self.tracer.start_span(name, context=parent, attributes=attributes, links=links)
+
+        try:
+            with trace.use_span(span, end_on_exit=False, record_exception=True, set_status_on_exception=True):
                 yield span
+        finally:
+            with self.counters.timed('span.end'):
+                span.end()
@@ -0,0 +1,94 @@
+#
+# This file is part of the Ingram Micro CloudBlue RnD Integration Connectors SDK.
+#
+# Copyright (c) 2023 Ingram Micro. All Rights Reserved.
+#
+import json
+from typing import Any, Dict, List, Mapping, Optional
+
+TRUTHY_VALUES = ('1', 'true', 'yes', 'on')
+
+
+def get_flag(config: dict, key: str, default: bool = False) -> bool:
+    """
+    Read a boolean flag from the config, the config usually comes from environment
+    variables so string values like 'true' or '1' are accepted too.
+    :param config: The configuration dictionary.
+    :param key: The key to read.
+    :param default: The value to return if the key is not present.
+    :return: bool
+    """
+    value = config.get(key)
+    if value is None:
+        return default
+
+    if isinstance(value, bool):
+        return value
+
+    return str(value).strip().lower() in TRUTHY_VALUES
+
+
+def get_number(config: dict, key: str, default: Optional[Any] = None, cast=int):
+    """
+    Read a number from the config casting it with the given callable, if the value
+    is not present or is not a valid number the default value is returned.
+    :param config: The configuration dictionary.
+    :param key: The key to read.
+    :param default: The value to return if the key is not present or invalid.
+    :param cast: The callable used to cast the value, int by default.
+    :return: The casted value or the default one.
+    """
+    value = config.get(key)
+    if value is None or value == '':
+        return default
+
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def get_list(config: dict, key: str, default: Optional[List[Any]] = None, cast=str) -> Optional[List[Any]]:
+    """
+    Read a list from the config casting each item with the given callable, comma separated
+    strings like '50,100,250' are accepted too. If the value is not present or any item is
+    not valid the default value is returned.
+    :param config: The configuration dictionary.
+    :param key: The key to read.
+    :param default: The value to return if the key is not present or invalid.
+    :param cast: The callable used to cast each item, str by default.
+    :return: The list of casted items or the default one.
+    """
+    value = config.get(key)
+    if value is None or value == '':
+        return default
+
+    if isinstance(value, str):
+        value = [item.strip() for item in value.split(',') if item.strip()]
+
+    try:
+        return [cast(item) for item in value]
+    except (TypeError, ValueError):
+        return default
+
+
+def get_mapping(config: dict, key: str, default: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Read a mapping from the config, JSON object strings are accepted too. If the value is
+    not present or is not a valid mapping the default value is returned.
+    :param config: The configuration dictionary.
+    :param key: The key to read.
+    :param default: The value to return if the key is not present or invalid.
+    :return: The mapping or the default one.
+    """
+    value = config.get(key)
+    if value is None or value == '':
+        return default
+
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return default
+
+    return dict(value) if isinstance(value, Mapping) else default
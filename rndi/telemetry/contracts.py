@@ -4,15 +4,21 @@
 # Copyright (c) 2023 Ingram Micro. All Rights Reserved.
 #
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Iterable
+from contextlib import contextmanager
+from threading import Event
+from typing import Any, Callable, Dict, Iterable, Iterator, MutableMapping, Optional, Tuple, Union
 
+from opentelemetry.context import Context
 from opentelemetry.trace import Span
+from rndi.telemetry.decorators import build_traced_decorator
 
 
 class Observer(ABC):  # pragma: no cover
     """
     Observer contract, this will provide the interface to trace, do metrics and logs.
     """
+    # the event to set to stop the periodic stats log, if it was started by the provider.
+    stats_reporter: Optional[Event] = None
 
     @abstractmethod
     def trace(self, name: str, context: Dict[str, Any]) -> Iterable[Span]:
@@ -22,3 +28,71 @@ class Observer(ABC):  # pragma: no cover
         :param context: The context for the trace, usually a raw request.
         :return: None
         """
+
+    def traced(self, name: str, context: Union[str, int] = 'request') -> Callable[[Callable], Callable]:
+        """
+        Decorator to trace each call of a function (sync, generator, async or async generator).
+        The span name and the argument holding the context are resolved once at decoration time.
+        :param name: The name of the span we will create.
+        :param context: The name or the position of the argument holding the context.
+        :return: The decorator.
+        """
+        return build_traced_decorator(self.trace, name, context)
+
+    @contextmanager
+    def trace_batch(
+            self,
+            name: str,
+            contexts: Iterable[Dict[str, Any]],
+            item_name: Optional[str] = None,
+    ) -> Iterator[Iterator[Tuple[Dict[str, Any], Optional[Span]]]]:
+        """
+        Trace a page of requests processed in one loop, each request is traced as its own
+        Business Transaction while it is being iterated.
+        :param name: The name of the span of the batch.
+        :param contexts: The contexts of each item, usually raw requests.
+        :param item_name: The name of the span of each item, the batch name by default.
+        :return: An iterator of (context, span) tuples.
+        """
+        def _items():
+            for context in contexts:
+                with self.trace(item_name or name, context) as span:
+                    yield context, span
+
+        items = _items()
+        try:
+            yield items
+        finally:
+            items.close()
+
+    def dump_flight_recorder(self, reason: str = 'manual') -> None:
+        """
+        Dump the recently finished spans kept by the flight recorder, if the observer has one.
+        :param reason: The reason of the dump.
+        :return: None
+        """
+        return None
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the overhead counters of the observer itself, if the observer measures them.
+        :return: The counters by name.
+        """
+        return {}
+
+    def inject(self, carrier: MutableMapping[str, str]) -> MutableMapping[str, str]:
+        """
+        Inject the W3C trace context (traceparent/tracestate) of the current span into the
+        carrier, so a downstream service or worker can continue the trace.
+        :param carrier: HTTP headers, task queue message metadata or request fields.
+        :return: The carrier.
+        """
+        return carrier
+
+    def extract(self, carrier: Dict[str, Any]) -> Optional[Context]:
+        """
+        Extract the W3C trace context (traceparent/tracestate) from the carrier.
+        :param carrier: HTTP headers, task queue message metadata or request fields.
+        :return: The extracted context or None if the carrier does not have a valid one.
+        """
+        return None
@@ -0,0 +1,163 @@
+#
+# This file is part of the Ingram Micro CloudBlue RnD Integration Connectors SDK.
+#
+# Copyright (c) 2023 Ingram Micro. All Rights Reserved.
+#
+import inspect
+from contextvars import Context, copy_context
+from functools import wraps
+from typing import Any, Callable, ContextManager, Dict, Generator, Iterator, Tuple, Union
+
+
+def context_argument(func: Callable, context: Union[str, int]) -> Callable[[Tuple, Dict[str, Any]], Any]:
+    """
+    Resolve once where the request context is in the arguments of a function, both by name
+    and by position, and return the function that gets it from the arguments of a call.
+    :param func: The decorated function.
+    :param context: The name or the position of the argument holding the request context.
+    :return: A function that gets the context from the (args, kwargs) of a call.
+    """
+    parameters = list(inspect.signature(func).parameters.values())
+    positional = (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD)
+    if isinstance(context, int):
+        index, name = context, None
+        if context < len(parameters) and parameters[context].kind is inspect.Parameter.POSITIONAL_OR_KEYWORD:
+            name = parameters[context].name
+    else:
+        parameter = next((parameter for parameter in parameters if parameter.name == context), None)
+        if parameter is None:
+            raise ValueError(f"{func.__qualname__} does not have a {context} argument.")
+        index = parameters.index(parameter) if parameter.kind in positional else None
+        name = None if parameter.kind is inspect.Parameter.POSITIONAL_ONLY else context
+
+    def _get(args: Tuple, kwargs: Dict[str, Any]) -> Any:
+        if index is not None and index < len(args):
+            return args[index]
+
+        return kwargs.get(name, {}) if name is not None else {}
+
+    return _get
+
+
+class _IsolatedTrace:
+    """
+    A trace entered in its own copy of the context, so the span of a suspended generator is
+    not the current span of the code consuming it, and the trace is exited in the context
+    where it was entered, wherever the generator is resumed or closed.
+    """
+    __slots__ = ('context', 'manager')
+
+    def __init__(self, manager: ContextManager):
+        self.context = copy_context()
+        self.manager = manager
+
+    def __enter__(self):
+        return self.context.run(self.manager.__enter__)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return self.context.run(self.manager.__exit__, exc_type, exc_val, exc_tb)
+
+
+def _run_in_context(context: Context, iterator: Iterator) -> Generator:
+    """
+    Delegate to a generator (or to the iterator of an awaitable) running each of its steps
+    in the given context.
+    """
+    send, message = iterator.send, None
+    while True:
+        try:
+            signal = context.run(send, message)
+        except StopIteration as stop:
+            return stop.value
+
+        try:
+            message = yield signal
+            send = iterator.send
+        except (Exception, GeneratorExit) as error:
+            send, message = iterator.throw, error
+
+
+class _InContext:
+    """
+    Awaitable running each step of the given awaitable in the given context.
+    """
+    __slots__ = ('context', 'awaitable')
+
+    def __init__(self, context: Context, awaitable):
+        self.context = context
+        self.awaitable = awaitable
+
+    def __await__(self):
+        return _run_in_context(self.context, self.awaitable.__await__())
+
+
+def build_traced_decorator(
+        trace: Callable[[str, Dict[str, Any]], ContextManager],
+        name: str,
+        context: Union[str, int],
+) -> Callable[[Callable], Callable]:
+    """
+    Build a decorator that traces each call of the decorated function (sync, generator,
+    async or async generator) with the given trace function, the span name and the
+    position of the context are resolved at decoration time.
+    The generators are traced across their whole iteration, but their trace and their steps
+    run in their own copy of the context: while a generator is suspended, its span is not the
+    current one of the consumer.
+    :param trace: The trace function, usually the Observer trace method.
+    :param name: The name of the span.
+    :param context: The name or the position of the argument holding the request context.
+    :return: The decorator.
+    """
+
+    def _decorator(func: Callable) -> Callable:
+        get_context = context_argument(func, context)
+
+        if inspect.isasyncgenfunction(func):
+            @wraps(func)
+            async def _async_generator(*args, **kwargs):
+                isolated = _IsolatedTrace(trace(name, get_context(args, kwargs)))
+                with isolated:
+                    generator = func(*args, **kwargs)
+                    send, message = generator.asend, None
+                    while True:
+                        try:
+                            item = await _InContext(isolated.context, send(message))
+                        except StopAsyncIteration:
+                            return
+
+                        try:
+                            message = yield item
+                            send = generator.asend
+                        except GeneratorExit:
+                            await _InContext(isolated.context, generator.aclose())
+                            raise
+                        except Exception as error:
+                            send, message = generator.athrow, error
+
+            return _async_generator
+
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def _coroutine(*args, **kwargs):
+                with trace(name, get_context(args, kwargs)):
+                    return await func(*args, **kwargs)
+
+            return _coroutine
+
+        if inspect.isgeneratorfunction(func):
+            @wraps(func)
+            def _generator(*args, **kwargs):
+                isolated = _IsolatedTrace(trace(name, get_context(args, kwargs)))
+                with isolated:
+                    return (yield from _run_in_context(isolated.context, func(*args, **kwargs)))
+
+            return _generator
+
+        @wraps(func)
+        def _function(*args, **kwargs):
+            with trace(name, get_context(args, kwargs)):
+                return func(*args, **kwargs)
+
+        return _function
+
+    return _decorator
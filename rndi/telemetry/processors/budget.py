@@ -0,0 +1,172 @@
+#
+# This file is part of the Ingram Micro CloudBlue RnD Integration Connectors SDK.
+#
+# Copyright (c) 2023 Ingram Micro. All Rights Reserved.
+#
+from typing import Any, Mapping, Optional, Sequence
+
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import Event, ReadableSpan, Span, SpanProcessor
+from opentelemetry.trace import Link
+from rndi.telemetry.stats import ObserverStats
+
+# approximate size of the non string values and of the identifiers of a link.
+SCALAR_SIZE = 8
+LINK_SIZE = 24
+
+
+def value_size(value: Any) -> int:
+    """
+    Approximate the size in bytes of an attribute value, strings are measured by their
+    length to keep the estimation cheap.
+    :param value: The attribute value.
+    :return: The approximate size.
+    """
+    if isinstance(value, (str, bytes)):
+        return len(value)
+
+    if isinstance(value, (list, tuple)):
+        return sum(value_size(item) for item in value)
+
+    return 0 if value is None else SCALAR_SIZE
+
+
+def attributes_size(attributes: Optional[Mapping[str, Any]]) -> int:
+    if not attributes:
+        return 0
+
+    return sum(len(key) + value_size(value) for key, value in attributes.items())
+
+
+def fixed_size(attributes: Mapping[str, Any]) -> int:
+    """
+    Approximate the size in bytes of the attributes that cannot be truncated: the keys and
+    the non string values.
+    """
+    return sum(len(key) + (0 if isinstance(value, str) else value_size(value)) for key, value in attributes.items())
+
+
+def span_size(span: ReadableSpan) -> int:
+    """
+    Approximate the size in bytes of a finished span: its name, attributes, events and links.
+    :param span: The span.
+    :return: The approximate size.
+    """
+    return (
+        len(span.name)
+        + attributes_size(span.attributes)
+        + sum(len(event.name) + SCALAR_SIZE + attributes_size(event.attributes) for event in span.events)
+        + sum(LINK_SIZE + attributes_size(link.attributes) for link in span.links)
+    )
+
+
+def fair_length(lengths: Sequence[int], available: int) -> Optional[int]:
+    """
+    Get the maximum length the strings can keep so their total length fits in the available
+    bytes, the short strings are kept whole and only the longest ones are truncated.
+    :param lengths: The lengths of the strings.
+    :param available: The available bytes.
+    :return: The maximum length or None if the strings already fit.
+    """
+    remaining = max(available, 0)
+    pending = len(lengths)
+    for length in sorted(lengths):
+        if length * pending > remaining:
+            return remaining // pending
+        remaining -= length
+        pending -= 1
+
+    return None
+
+
+class SpanBudgetSpanProcessor(SpanProcessor):
+    """
+    Span processor that enforces a per span byte budget before handing the finished spans to
+    the delegated processor, so the spans waiting in the export queue never hold arbitrarily
+    large values. A span over the budget is replaced by a copy where the newest events are
+    dropped while the rest does not fit and the longest string values (of the attributes,
+    the events and the links) are truncated to a common length.
+    It also counts in the observer stats the spans and values truncated by the budget and the
+    attributes, events and links dropped by the span limits of the tracer provider.
+    """
+
+    def __init__(self, delegate: SpanProcessor, max_bytes: Optional[int] = None, stats: Optional[ObserverStats] = None):
+        self.delegate = delegate
+        self.max_bytes = max_bytes
+        self.stats = ObserverStats() if stats is None else stats
+
+    def on_start(self, span: Span, parent_context: Optional[Context] = None) -> None:
+        self.delegate.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        if self.stats.enabled:
+            self._count_dropped(span)
+
+        if self.max_bytes is not None and span_size(span) > self.max_bytes:
+            span = self.trim(span)
+            self.stats.add('limits.truncated_spans')
+
+        self.delegate.on_end(span)
+
+    def shutdown(self) -> None:
+        self.delegate.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.delegate.force_flush(timeout_millis)
+
+    def trim(self, span: ReadableSpan) -> ReadableSpan:
+        """
+        Build a copy of the span that fits in the byte budget.
+        :param span: The span over the budget.
+        :return: The trimmed span.
+        """
+        attributes = dict(span.attributes or {})
+        events = [(event.name, dict(event.attributes or {}), event.timestamp) for event in span.events]
+        links = [(link.context, dict(link.attributes or {})) for link in span.links]
+
+        fixed = len(span.name) + fixed_size(attributes) + sum(
+            LINK_SIZE + fixed_size(link_attributes) for _, link_attributes in links
+        ) + sum(len(name) + SCALAR_SIZE + fixed_size(event_attributes) for name, event_attributes, _ in events)
+
+        # the newest events go first while the values that cannot be truncated do not fit.
+        while events and fixed > self.max_bytes:
+            name, event_attributes, _ = events.pop()
+            fixed -= len(name) + SCALAR_SIZE + fixed_size(event_attributes)
+
+        containers = [attributes] + [event_attributes for _, event_attributes, _ in events]
+        containers += [link_attributes for _, link_attributes in links]
+        strings = [
+            (container, key) for container in containers
+            for key, value in container.items() if isinstance(value, str)
+        ]
+
+        length = fair_length([len(container[key]) for container, key in strings], self.max_bytes - fixed)
+        if length is not None:
+            for container, key in strings:
+                if len(container[key]) > length:
+                    container[key] = container[key][:length]
+                    self.stats.add('limits.truncated_values')
+
+        return ReadableSpan(
+            name=span.name,
+            context=span.context,
+            parent=span.parent,
+            resource=span.resource,
+            attributes=attributes,
+            events=[Event(name, event_attributes, timestamp) for name, event_attributes, timestamp in events],
+            links=[Link(context, link_attributes) for context, link_attributes in links],
+            kind=span.kind,
+            status=span.status,
+            start_time=span.start_time,
+            end_time=span.end_time,
+            instrumentation_scope=span.instrumentation_scope,
+        )
+
+    def _count_dropped(self, span: ReadableSpan):
+        for name, dropped in (
+                ('limits.dropped_attributes', span.dropped_attributes),
+                ('limits.dropped_events', span.dropped_events),
+                ('limits.dropped_links', span.dropped_links),
+        ):
+            if dropped:
+                self.stats.add(name, dropped)
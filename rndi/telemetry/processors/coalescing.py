@@ -0,0 +1,243 @@
+#
+# This file is part of the Ingram Micro CloudBlue RnD Integration Connectors SDK.
+#
+# Copyright (c) 2023 Ingram Micro. All Rights Reserved.
+#
+import re
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional
+
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor
+from opentelemetry.trace import StatusCode
+
+SQL_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\$\d+")
+SQL_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+SQL_NUMERIC_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+SQL_VALUE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+SQL_VALUE_LISTS = re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+")
+WHITESPACES = re.compile(r"\s+")
+
+
+def normalize_sql_statement(statement: str) -> str:
+    """
+    Normalize a SQL statement replacing the literals and placeholders with a '?' and
+    collapsing the value lists, so the same query executed with different values (N+1
+    patterns or batch inserts) produces the same normalized statement.
+    :param statement: The raw SQL statement.
+    :return: The normalized SQL statement.
+    """
+    statement = SQL_PLACEHOLDER.sub('?', statement)
+    statement = SQL_STRING_LITERAL.sub('?', statement)
+    statement = SQL_NUMERIC_LITERAL.sub('?', statement)
+    statement = SQL_VALUE_LIST.sub('(?)', statement)
+    statement = SQL_VALUE_LISTS.sub('(?)', statement)
+    return WHITESPACES.sub(' ', statement).strip()
+
+
+def pgsql_statement_key(span: ReadableSpan) -> Optional[str]:
+    """
+    Group the psycopg2 spans by its normalized statement, any other span is not eligible
+    to be coalesced.
+    :param span: The finished span.
+    :return: The normalized statement or None if the span is not a PostgreSQL one.
+    """
+    attributes = span.attributes or {}
+    if attributes.get('db.system', attributes.get('db.system.name')) != 'postgresql':
+        return None
+
+    statement = attributes.get('db.statement', attributes.get('db.query.text'))
+    if not statement:
+        return None
+
+    return normalize_sql_statement(statement)
+
+
+class SpanRun:
+    """
+    A run of consecutive finished spans with the same key under the same parent. Only the
+    first span (and the first failed one) are kept, the rest are just accounted.
+    """
+    __slots__ = ('key', 'first', 'first_error', 'count', 'errors', 'total', 'minimum', 'maximum', 'start_time',
+                 'end_time')
+
+    def __init__(self, key: str, span: ReadableSpan):
+        self.key = key
+        self.first = span
+        self.first_error: Optional[ReadableSpan] = None
+        self.count = 0
+        self.errors = 0
+        self.total = 0
+        self.minimum: Optional[int] = None
+        self.maximum: Optional[int] = None
+        self.start_time = span.start_time
+        self.end_time = span.end_time
+        self.add(span)
+
+    def matches(self, span: ReadableSpan, key: str) -> bool:
+        return self.key == key and self.first.name == span.name
+
+    def add(self, span: ReadableSpan):
+        duration = span.end_time - span.start_time
+        self.count += 1
+        self.total += duration
+        self.minimum = duration if self.minimum is None else min(self.minimum, duration)
+        self.maximum = duration if self.maximum is None else max(self.maximum, duration)
+        self.start_time = min(self.start_time, span.start_time)
+        self.end_time = max(self.end_time, span.end_time)
+
+        if span.status.status_code is StatusCode.ERROR:
+            self.errors += 1
+            if self.first_error is None:
+                self.first_error = span
+
+
+class CoalescingSpanProcessor(SpanProcessor):
+    """
+    Span processor that groups consecutive finished spans with the same key under the same
+    parent into one summary span before handing them to the delegated processor (usually
+    the BatchSpanProcessor). The summary span carries the count, the total, min and max
+    durations and the first error of the run.
+    A run is flushed when a different span finishes under the same parent, when the parent
+    finishes, when the processor is flushed or when there are too many pending runs.
+    """
+
+    def __init__(
+            self,
+            delegate: SpanProcessor,
+            key: Callable[[ReadableSpan], Optional[str]] = pgsql_statement_key,
+            max_pending_runs: int = 1024,
+    ):
+        self.delegate = delegate
+        self.key = key
+        self.max_pending_runs = max_pending_runs
+        self._runs: Dict[int, SpanRun] = {}
+        self._lock = Lock()
+
+    def on_start(self, span: Span, parent_context: Optional[Context] = None) -> None:
+        self.delegate.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        individual = self.keep_individually(span)
+        key = None if individual else self._key_of(span)
+        pending: List[SpanRun] = []
+        coalesced = False
+
+        with self._lock:
+            children = self._runs.pop(span.context.span_id, None)
+            if children is not None:
+                pending.append(children)
+
+            if key is not None:
+                parent_id = span.parent.span_id
+                run = self._runs.get(parent_id)
+                if run is not None and run.matches(span, key):
+                    run.add(span)
+                else:
+                    if run is not None:
+                        pending.append(self._runs.pop(parent_id))
+                    self._runs[parent_id] = self.new_run(key, span)
+                    if len(self._runs) > self.max_pending_runs:
+                        pending.append(self._runs.pop(next(iter(self._runs))))
+                coalesced = True
+            elif not individual and span.parent is not None and span.parent.span_id in self._runs:
+                pending.append(self._runs.pop(span.parent.span_id))
+
+        for run in pending:
+            self._emit(run)
+
+        if not coalesced:
+            self.delegate.on_end(span)
+
+    def shutdown(self) -> None:
+        self._flush_runs()
+        self.delegate.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        self._flush_runs()
+        return self.delegate.force_flush(timeout_millis)
+
+    def keep_individually(self, span: ReadableSpan) -> bool:
+        """
+        Decide if a span must be exported as it is, without coalescing it and without
+        breaking the run of its siblings.
+        :param span: The finished span.
+        :return: bool
+        """
+        return False
+
+    def new_run(self, key: str, span: ReadableSpan) -> SpanRun:
+        """
+        Start a new run of spans with the given key.
+        :param key: The key of the run.
+        :param span: The first span of the run.
+        :return: The new run.
+        """
+        return SpanRun(key, span)
+
+    def summary_attributes(self, run: SpanRun) -> Dict[str, Any]:
+        """
+        Compute the attributes added to the summary span of a run.
+        :param run: The run being summarized.
+        :return: The summary attributes.
+        """
+        attributes = {
+            'coalesced.key': run.key,
+            'coalesced.count': run.count,
+            'coalesced.duration.total_ms': run.total / 1e6,
+            'coalesced.duration.min_ms': run.minimum / 1e6,
+            'coalesced.duration.max_ms': run.maximum / 1e6,
+        }
+
+        if run.first_error is not None:
+            attributes['coalesced.errors'] = run.errors
+            attributes['coalesced.first_error'] = run.first_error.status.description or run.first_error.name
+
+        return attributes
+
+    def summarize(self, run: SpanRun) -> ReadableSpan:
+        """
+        Build the summary span of a run, a run of a single span is just that span.
+        :param run: The run to summarize.
+        :return: The span to export.
+        """
+        if run.count == 1:
+            return run.first
+
+        first = run.first
+        exemplar = run.first_error or first
+        attributes = dict(first.attributes or {})
+        attributes.update(self.summary_attributes(run))
+
+        return ReadableSpan(
+            name=first.name,
+            context=first.context,
+            parent=first.parent,
+            resource=first.resource,
+            attributes=attributes,
+            events=exemplar.events,
+            links=first.links,
+            kind=first.kind,
+            status=exemplar.status,
+            start_time=run.start_time,
+            end_time=run.end_time,
+            instrumentation_scope=first.instrumentation_scope,
+        )
+
+    def _key_of(self, span: ReadableSpan) -> Optional[str]:
+        # spans under a remote parent are never coalesced, their parent will not finish here.
+        if span.parent is None or span.parent.is_remote:
+            return None
+
+        return self.key(span)
+
+    def _emit(self, run: SpanRun):
+        self.delegate.on_end(self.summarize(run))
+
+    def _flush_runs(self):
+        with self._lock:
+            pending = list(self._runs.values())
+            self._runs.clear()
+
+        for run in pending:
+            self._emit(run)
@@ -0,0 +1,155 @@
+#
+# This file is part of the Ingram Micro CloudBlue RnD Integration Connectors SDK.
+#
+# Copyright (c) 2023 Ingram Micro. All Rights Reserved.
+#
+import re
+from bisect import bisect_left
+from typing import Any, Dict, List, Mapping, Optional, Pattern, Sequence, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor
+from opentelemetry.trace import StatusCode
+from rndi.telemetry.processors.coalescing import CoalescingSpanProcessor, SpanRun
+
+DEFAULT_URL_TEMPLATES: List[Tuple[Pattern, str]] = [
+    (re.compile(r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$"), '{uuid}'),
+    (re.compile(r"^[A-Z]{2,4}(?:-\d{2,6})+$"), '{id}'),
+    (re.compile(r"^\d+$"), '{n}'),
+]
+
+DEFAULT_LATENCY_BUCKETS_MS: Tuple[float, ...] = (50, 100, 250, 500, 1000, 2500, 5000)
+
+
+def compile_url_templates(templates: Mapping[str, str]) -> List[Tuple[Pattern, str]]:
+    """
+    Compile the given {pattern: placeholder} URL templates, they are matched against each
+    path segment before the default ones. The patterns that are not valid are ignored.
+    :param templates: The placeholder of each regular expression.
+    :return: The list of (pattern, placeholder) templates followed by the default ones.
+    """
+    compiled = []
+    for pattern, placeholder in templates.items():
+        try:
+            compiled.append((re.compile(pattern), str(placeholder)))
+        except re.error:
+            continue
+
+    return compiled + DEFAULT_URL_TEMPLATES
+
+
+def template_url(url: str, templates: Optional[List[Tuple[Pattern, str]]] = None) -> str:
+    """
+    Replace the identifiers in the path segments of a URL with placeholders and the
+    values of the query parameters with a '?', so all the calls to the same route
+    produce the same templated URL:
+    https://api.cnct.info/public/v1/requests/PR-1234-5678-9012?limit=10&offset=20
+    https://api.cnct.info/public/v1/requests/{id}?limit=?&offset=?
+    :param url: The raw URL.
+    :param templates: The list of (pattern, placeholder) applied to each path segment.
+    :return: The templated URL.
+    """
+    if templates is None:
+        templates = DEFAULT_URL_TEMPLATES
+
+    parts = urlsplit(url)
+    segments = []
+    for segment in parts.path.split('/'):
+        for pattern, placeholder in templates:
+            if pattern.match(segment):
+                segment = placeholder
+                break
+        segments.append(segment)
+
+    templated = f"{parts.scheme}://{parts.netloc}{'/'.join(segments)}" if parts.netloc else '/'.join(segments)
+    if parts.query:
+        templated += '?' + '&'.join(
+            f"{name}=?" if value else name for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        )
+
+    return templated
+
+
+def _http_attribute(span: ReadableSpan, *names: str) -> Any:
+    attributes = span.attributes or {}
+    for name in names:
+        value = attributes.get(name)
+        if value is not None:
+            return value
+
+    return None
+
+
+class HistogramSpanRun(SpanRun):
+    """
+    A run of spans that also accounts the latency of each span into a histogram.
+    """
+    __slots__ = ('bounds', 'buckets')
+
+    def __init__(self, key: str, span: ReadableSpan, bounds: Sequence[float]):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        super().__init__(key, span)
+
+    def add(self, span: ReadableSpan):
+        super().add(span)
+        self.buckets[bisect_left(self.bounds, (span.end_time - span.start_time) / 1e6)] += 1
+
+
+class HttpAggregatingSpanProcessor(CoalescingSpanProcessor):
+    """
+    Span processor that aggregates consecutive outgoing HTTP calls to the same templated
+    route under the same parent (polling loops, paginated listings) into one span with the
+    call count and a latency histogram. Failed calls and calls slower than the outlier
+    threshold are always exported individually.
+    """
+
+    def __init__(
+            self,
+            delegate: SpanProcessor,
+            templates: Optional[List[Tuple[Pattern, str]]] = None,
+            outlier_threshold_ms: float = 1000,
+            latency_buckets_ms: Sequence[float] = DEFAULT_LATENCY_BUCKETS_MS,
+            max_pending_runs: int = 1024,
+    ):
+        self.templates = templates
+        self.outlier_threshold_ms = outlier_threshold_ms
+        self.latency_buckets_ms = tuple(sorted(latency_buckets_ms))
+        super().__init__(delegate, self.route_key, max_pending_runs)
+
+    def route_key(self, span: ReadableSpan) -> Optional[str]:
+        method = _http_attribute(span, 'http.method', 'http.request.method')
+        url = _http_attribute(span, 'http.url', 'url.full')
+        if method is None or url is None:
+            return None
+
+        try:
+            return f"{method} {template_url(str(url), self.templates)}"
+        except ValueError:
+            # not a valid URL (an unclosed IPv6 host), the span is exported as it is.
+            return None
+
+    def keep_individually(self, span: ReadableSpan) -> bool:
+        if _http_attribute(span, 'http.method', 'http.request.method') is None:
+            return False
+
+        if span.status.status_code is StatusCode.ERROR:
+            return True
+
+        status_code = _http_attribute(span, 'http.status_code', 'http.response.status_code')
+        try:
+            if status_code is not None and int(status_code) >= 400:
+                return True
+        except (TypeError, ValueError):
+            """We don't want to break the span end at any cost, an unknown status is not an error"""
+
+        return (span.end_time - span.start_time) / 1e6 > self.outlier_threshold_ms
+
+    def new_run(self, key: str, span: ReadableSpan) -> SpanRun:
+        return HistogramSpanRun(key, span, self.latency_buckets_ms)
+
+    def summary_attributes(self, run: HistogramSpanRun) -> Dict[str, Any]:
+        attributes = super().summary_attributes(run)
+        attributes['coalesced.histogram.bounds_ms'] = [float(bound) for bound in run.bounds]
+        attributes['coalesced.histogram.counts'] = run.buckets
+        return attributes
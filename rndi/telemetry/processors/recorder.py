@@ -0,0 +1,194 @@
+#
+# This file is part of the Ingram Micro CloudBlue RnD Integration Connectors SDK.
+#
+# Copyright (c) 2023 Ingram Micro. All Rights Reserved.
+#
+import os
+import re
+import signal
+import tempfile
+from threading import Lock, Thread
+from time import monotonic, time_ns
+from typing import Dict, List, Optional
+
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor
+from opentelemetry.sdk.trace.export import SpanExporter
+from rndi.telemetry.processors.budget import span_size
+
+
+class FlightRecorderSpanProcessor(SpanProcessor):
+    """
+    Span processor that keeps the last N finished spans in a preallocated ring buffer, so
+    the full detail of the last minutes can be dumped on demand (a failed business
+    transaction, a signal or an explicit call) without exporting everything.
+    It must be added to the tracer provider alongside the exporting processor, so it also
+    records the spans that the coalescing processors will never export individually.
+    Besides the number of spans, the buffer is bounded by the approximate size in bytes of
+    the recorded spans, the oldest ones are evicted when it goes over max_bytes.
+    The spans are dumped as JSON lines files into the path (the temporary directory by
+    default), or pushed to the exporter if one is given instead. The exporter must be a
+    dedicated instance, the exporters do not support concurrent exports and the exporting
+    processor would already have exported most of the spans.
+    """
+
+    def __init__(
+            self,
+            capacity: int = 2048,
+            window_seconds: Optional[float] = 300,
+            path: Optional[str] = None,
+            exporter: Optional[SpanExporter] = None,
+            max_bytes: Optional[int] = 8 * 1024 * 1024,
+            min_dump_interval_seconds: float = 60,
+    ):
+        if capacity <= 0:
+            raise ValueError("The flight recorder capacity must be greater than 0.")
+
+        self.capacity = capacity
+        self.window_seconds = window_seconds
+        self.path = tempfile.gettempdir() if path is None and exporter is None else path
+        self.exporter = exporter
+        self.max_bytes = max_bytes
+        self.min_dump_interval_seconds = min_dump_interval_seconds
+        self._slots: List[Optional[ReadableSpan]] = [None] * capacity
+        self._sizes: List[int] = [0] * capacity
+        self._bytes = 0
+        self._oldest = 0
+        self._position = 0
+        self._lock = Lock()
+        self._dumps: Dict[str, float] = {}
+        self._dump_lock = Lock()
+        self._export_lock = Lock()
+
+    def on_start(self, span: Span, parent_context: Optional[Context] = None) -> None:
+        pass
+
+    def on_end(self, span: ReadableSpan) -> None:
+        size = span_size(span) if self.max_bytes is not None else 0
+        with self._lock:
+            index = self._position % self.capacity
+            self._bytes += size - self._sizes[index]
+            self._slots[index] = span
+            self._sizes[index] = size
+            self._position += 1
+            self._oldest = max(self._oldest, self._position - self.capacity)
+
+            # evict the oldest spans while over the budget, the last one is always kept.
+            while self.max_bytes is not None and self._bytes > self.max_bytes and self._oldest < self._position - 1:
+                index = self._oldest % self.capacity
+                self._bytes -= self._sizes[index]
+                self._slots[index] = None
+                self._sizes[index] = 0
+                self._oldest += 1
+
+    def shutdown(self) -> None:
+        pass
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return True
+
+    def snapshot(self) -> List[ReadableSpan]:
+        """
+        Get the recorded spans from the oldest to the newest one, if a window is configured
+        only the spans finished inside that window are returned.
+        :return: List[ReadableSpan]
+        """
+        with self._lock:
+            spans = [self._slots[position % self.capacity] for position in range(self._oldest, self._position)]
+
+        if self.window_seconds is None:
+            return spans
+
+        oldest = time_ns() - int(self.window_seconds * 1e9)
+        return [span for span in spans if span.end_time is not None and span.end_time >= oldest]
+
+    def request_dump(self, reason: str = 'manual') -> bool:
+        """
+        Dump the recorded spans in a background thread, so the caller (usually a failing
+        request) is never blocked by the IO. The dumps are debounced by reason: an error storm
+        only produces one dump every min_dump_interval_seconds.
+        :param reason: The reason of the dump, used in the file name.
+        :return: True if the dump was started, False if it was debounced.
+        """
+        now = monotonic()
+        with self._dump_lock:
+            last = self._dumps.get(reason)
+            if last is not None and now - last < self.min_dump_interval_seconds:
+                return False
+            self._dumps[reason] = now
+
+        Thread(target=self._dump_quietly, args=(reason,), name='rndi-telemetry-flight-recorder', daemon=True).start()
+        return True
+
+    def _dump_quietly(self, reason: str):
+        try:
+            self.dump(reason)
+        except Exception:
+            """We don't want to break the dump thread at any cost"""
+            return
+
+    def dump(self, reason: str = 'manual') -> Optional[str]:
+        """
+        Dump the recorded spans into a JSON lines file if a path is configured, otherwise
+        push them to the exporter.
+        :param reason: The reason of the dump, used in the file name.
+        :return: The path of the dumped file if any.
+        """
+        spans = self.snapshot()
+        if not spans:
+            return None
+
+        if self.path is not None:
+            # the reason is public, it must never point outside the dump directory.
+            reason = re.sub(r'[^\w.-]', '_', reason)
+            filename = os.path.join(self.path, f"flight-recorder-{os.getpid()}-{time_ns()}-{reason}.jsonl")
+            with open(filename, 'w', encoding='utf-8') as file:
+                for span in spans:
+                    file.write(span.to_json(indent=None))
+                    file.write('\n')
+            return filename
+
+        if self.exporter is not None:
+            with self._export_lock:
+                self.exporter.export(spans)
+
+        return None
+
+
+def install_dump_signal_handler(recorder: FlightRecorderSpanProcessor, signum: Optional[int] = None) -> bool:
+    """
+    Dump the flight recorder when the process receives the given signal (SIGUSR1 by
+    default). The dump is requested like any other one, so it is debounced and done in a
+    background thread, and the interrupted code is never blocked by the recorder lock or the
+    IO. The previous handler of the signal (the log reopening of some servers) is still called
+    after the dump is requested.
+    :param recorder: The flight recorder to dump.
+    :param signum: The signal number.
+    :return: True if the handler was installed, False if the platform or thread does not allow it.
+    """
+    if signum is None:
+        signum = getattr(signal, 'SIGUSR1', None)
+        if signum is None:
+            return False
+
+    try:
+        previous = signal.getsignal(signum)
+    except ValueError:
+        return False
+
+    def _dump(number: int, frame) -> None:
+        try:
+            recorder.request_dump('signal')
+        except Exception:
+            """We don't want to break the signal handling at any cost"""
+
+        if callable(previous):
+            previous(number, frame)
+
+    try:
+        signal.signal(signum, _dump)
+    except ValueError:
+        # signal handlers can only be installed from the main thread.
+        return False
+
+    return True
@@ -0,0 +1,181 @@
+#
+# This file is part of the Ingram Micro CloudBlue RnD Integration Connectors SDK.
+#
+# Copyright (c) 2023 Ingram Micro. All Rights Reserved.
+#
+import os
+import weakref
+from collections import deque
+from itertools import count
+from threading import Event, local, Lock, Thread
+from time import monotonic, sleep
+from typing import Deque, List, Optional
+
+from opentelemetry.context import _SUPPRESS_INSTRUMENTATION_KEY, attach, Context, detach, set_value
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor
+from opentelemetry.sdk.trace.export import SpanExporter
+
+
+class ShardedBatchSpanProcessor(SpanProcessor):
+    """
+    Batch span processor that buffers the finished spans in sharded buffers instead of a
+    single locked queue. Each thread is pinned to one shard on its first span and appends
+    to it without taking any lock (deque appends are atomic). The shards are unbounded, the
+    queue size is bounded by a shared approximate counter, so a single busy thread can use
+    the whole queue. The export thread is woken up when a batch is buffered, or after the
+    schedule delay, and it recomputes the exact size after each export, so the counter never
+    drifts. When the queue is more than half full the producer yields the GIL so the export
+    thread is not starved by the worker threads.
+    It keeps the BatchSpanProcessor guarantees: about max_queue_size buffered spans (the
+    oldest span of the thread shard is dropped), export batches of at most
+    max_export_batch_size spans, an export at least every schedule_delay_millis and a new
+    export thread in the child processes after a fork. The queue bound is approximate: the
+    producers and the export thread update the counter without a lock, so between two exports
+    it can go over max_queue_size by a few spans for each concurrent producer.
+    Unlike the BatchSpanProcessor, force_flush exports in the calling thread, it stops
+    exporting new batches once timeout_millis is over and the rest is left to the export thread.
+    """
+
+    def __init__(
+            self,
+            span_exporter: SpanExporter,
+            max_queue_size: int = 2048,
+            schedule_delay_millis: float = 5000,
+            max_export_batch_size: int = 512,
+            shards: int = 16,
+    ):
+        if max_export_batch_size > max_queue_size:
+            raise ValueError("max_export_batch_size must be less than or equal to max_queue_size.")
+
+        self.span_exporter = span_exporter
+        self.schedule_delay = schedule_delay_millis / 1000
+        self.max_queue_size = max_queue_size
+        self.max_export_batch_size = max_export_batch_size
+        self.dropped = 0
+        self._shards: List[Deque[ReadableSpan]] = [deque() for _ in range(shards)]
+        self._backpressure = max(max_export_batch_size, max_queue_size // 2)
+        self._done = False
+        self._initialize()
+
+        if hasattr(os, 'register_at_fork'):
+            reinitialize = weakref.WeakMethod(self._at_fork_reinit)
+
+            def _after_in_child() -> None:
+                method = reinitialize()
+                if method is not None:
+                    method()
+
+            os.register_at_fork(after_in_child=_after_in_child)
+
+    def _initialize(self):
+        self._queued = 0
+        self._counter = count()
+        self._local = local()
+        self._export_lock = Lock()
+        self._wakeup = Event()
+        self._worker = Thread(target=self._run, name='rndi-telemetry-sharded-span-processor', daemon=True)
+        self._worker.start()
+
+    def _at_fork_reinit(self):
+        # the export thread does not survive the fork and the locks may be held by it.
+        for shard in self._shards:
+            shard.clear()
+        self._initialize()
+
+    def on_start(self, span: Span, parent_context: Optional[Context] = None) -> None:
+        pass
+
+    def on_end(self, span: ReadableSpan) -> None:
+        if self._done or not span.context.trace_flags.sampled:
+            return
+
+        shard = self._shard()
+        if self._queued >= self.max_queue_size:
+            self.dropped += 1
+            try:
+                shard.popleft()
+            except IndexError:
+                return
+        else:
+            self._queued += 1
+
+        shard.append(span)
+        queued = self._queued
+        if queued >= self.max_export_batch_size and not self._wakeup.is_set():
+            self._wakeup.set()
+        if queued > self._backpressure:
+            # the export thread is falling behind, yield to it before dropping spans.
+            sleep(0)
+
+    def shutdown(self) -> None:
+        if self._done:
+            return
+
+        self._done = True
+        self._wakeup.set()
+        self._worker.join()
+        self.span_exporter.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        if self._done:
+            return False
+
+        return self._export(monotonic() + timeout_millis / 1000)
+
+    def _shard(self) -> Deque[ReadableSpan]:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._shards[next(self._counter) % len(self._shards)]
+            self._local.shard = shard
+            return shard
+
+    def _run(self):
+        while not self._done:
+            self._wakeup.wait(self.schedule_delay)
+            self._wakeup.clear()
+            self._export()
+
+        self._export()
+
+    def _export(self, deadline: Optional[float] = None) -> bool:
+        if deadline is None:
+            self._export_lock.acquire()
+        elif not self._export_lock.acquire(timeout=max(deadline - monotonic(), 0)):
+            return False
+
+        try:
+            batch = []
+            for shard in self._shards:
+                while True:
+                    try:
+                        batch.append(shard.popleft())
+                    except IndexError:
+                        break
+                    if len(batch) >= self.max_export_batch_size:
+                        self._export_batch(batch)
+                        batch = []
+                        if deadline is not None and monotonic() >= deadline:
+                            return False
+
+            if batch:
+                self._export_batch(batch)
+
+            return True
+        finally:
+            # the producers update the counter without any lock, fix it with the exact size.
+            self._queued = sum(len(shard) for shard in self._shards)
+            self._export_lock.release()
+
+    def _export_batch(self, batch: List[ReadableSpan]):
+        # the spans leave the queue before the (slow) export, so the producers can use their room.
+        self._queued -= len(batch)
+
+        # the export must not be traced by the automatic instrumentation (requests).
+        token = attach(set_value(_SUPPRESS_INSTRUMENTATION_KEY, True))
+        try:
+            self.span_exporter.export(batch)
+        except Exception:
+            """We don't want to break the export thread at any cost"""
+        finally:
+            detach(token)
@@ -0,0 +1,218 @@
+#
+# This file is part of the Ingram Micro CloudBlue RnD Integration Connectors SDK.
+#
+# Copyright (c) 2023 Ingram Micro. All Rights Reserved.
+#
+import base64
+import os
+import sys
+import zlib
+from collections import Counter
+from threading import Condition, get_ident, Thread
+from time import monotonic
+from types import CodeType, FrameType
+from typing import Dict, List, Optional, Tuple
+
+from opentelemetry.trace import Span
+
+# below the 8192 characters the Azure exporter keeps of each custom property.
+DEFAULT_PROFILE_MAX_BYTES = 4096
+
+
+class ProfiledTransaction:
+    """
+    A running transaction registered in the profiler.
+    """
+    __slots__ = ('thread_id', 'deadline', 'samples')
+
+    def __init__(self, thread_id: int, deadline: float):
+        self.thread_id = thread_id
+        self.deadline = deadline
+        self.samples: Counter = Counter()
+
+
+class SlowTransactionProfiler:
+    """
+    Low overhead sampling profiler for slow transactions. A single background thread sleeps
+    until the oldest running transaction exceeds the threshold, and from that moment it
+    periodically reads the stack of the thread running it with sys._current_frames.
+    Transactions faster than the threshold are never sampled, they only pay the register
+    and unregister of the transaction.
+    """
+
+    def __init__(
+            self,
+            threshold_ms: float = 1000,
+            interval_ms: float = 10,
+            max_depth: int = 64,
+            max_bytes: Optional[int] = DEFAULT_PROFILE_MAX_BYTES,
+    ):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.max_depth = max_depth
+        self.max_bytes = max_bytes
+        self._transactions: List[ProfiledTransaction] = []
+        self._labels: Dict[CodeType, str] = {}
+        self._condition = Condition()
+        self._thread: Optional[Thread] = None
+
+    def start(self) -> ProfiledTransaction:
+        """
+        Register the transaction running in the current thread.
+        :return: The registered transaction.
+        """
+        transaction = ProfiledTransaction(get_ident(), monotonic() + self.threshold)
+        with self._condition:
+            self._transactions.append(transaction)
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name='rndi-telemetry-profiler', daemon=True)
+                self._thread.start()
+            elif len(self._transactions) == 1:
+                self._condition.notify()
+
+        return transaction
+
+    def stop(self, transaction: ProfiledTransaction) -> Dict[str, int]:
+        """
+        Unregister the transaction and return its folded stacks.
+        :param transaction: The registered transaction.
+        :return: The number of samples by folded stack.
+        """
+        with self._condition:
+            self._transactions.remove(transaction)
+            return dict(transaction.samples)
+
+    def sample(self) -> Optional[float]:
+        """
+        Sample the stacks of the slow transactions.
+        :return: The seconds to wait before the next sampling, None if there is nothing to sample.
+        """
+        with self._condition:
+            if not self._transactions:
+                return None
+            now = monotonic()
+            slow = [transaction for transaction in self._transactions if transaction.deadline <= now]
+            if not slow:
+                return min(transaction.deadline for transaction in self._transactions) - now
+
+        frames = sys._current_frames()
+        stacks = [(transaction, self._fold(frames.get(transaction.thread_id))) for transaction in slow]
+
+        with self._condition:
+            for transaction, stack in stacks:
+                if stack:
+                    transaction.samples[stack] += 1
+
+        return self.interval
+
+    def _run(self):
+        while True:
+            timeout = self.sample()
+            with self._condition:
+                if timeout is None and self._transactions:
+                    continue
+                self._condition.wait(timeout)
+
+    def _fold(self, frame: Optional[FrameType]) -> str:
+        labels = []
+        while frame is not None and len(labels) < self.max_depth:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+                self._labels[code] = label
+            labels.append(label)
+            frame = frame.f_back
+
+        return ';'.join(reversed(labels))
+
+
+def encode_folded_profile(samples: Dict[str, int], max_stacks: int = 200, max_bytes: Optional[int] = None) -> str:
+    """
+    Encode the most frequent folded stacks ("a;b;c count" lines) compressed with zlib
+    and encoded in base64, so it can be attached as a span attribute.
+    :param samples: The number of samples by folded stack.
+    :param max_stacks: The maximum number of stacks to encode.
+    :param max_bytes: If provided, the least frequent stacks are dropped until the encoded profile fits.
+    :return: The encoded profile.
+    """
+    return fit_folded_profile(samples, max_stacks, max_bytes)[0]
+
+
+def fit_folded_profile(
+        samples: Dict[str, int],
+        max_stacks: int = 200,
+        max_bytes: Optional[int] = None,
+) -> Tuple[str, int]:
+    """
+    Encode the most frequent folded stacks that fit in max_bytes. A truncated value is not
+    valid base64 nor zlib anymore, so the profile is kept under the limits applied to the
+    attribute values by dropping whole stacks, searching the number of stacks that fits.
+    :param samples: The number of samples by folded stack.
+    :param max_stacks: The maximum number of stacks to encode.
+    :param max_bytes: If provided, the maximum length of the encoded profile.
+    :return: The encoded profile and the number of encoded stacks.
+    """
+    stacks = Counter(samples).most_common(max_stacks)
+
+    def _encode(count: int) -> str:
+        folded = '\n'.join(f"{stack} {hits}" for stack, hits in stacks[:count])
+        return base64.b64encode(zlib.compress(folded.encode('utf-8'))).decode('ascii')
+
+    encoded = _encode(len(stacks))
+    if max_bytes is None or len(encoded) <= max_bytes:
+        return encoded, len(stacks)
+
+    low, high = 0, len(stacks) - 1
+    encoded = _encode(low)
+    while low < high:
+        middle = (low + high + 1) // 2
+        candidate = _encode(middle)
+        if len(candidate) <= max_bytes:
+            low, encoded = middle, candidate
+        else:
+            high = middle - 1
+
+    return encoded, low
+
+
+def decode_folded_profile(encoded: str) -> Dict[str, int]:
+    """
+    Decode a profile encoded with encode_folded_profile.
+    :param encoded: The encoded profile.
+    :return: The number of samples by folded stack.
+    """
+    folded = zlib.decompress(base64.b64decode(encoded)).decode('utf-8')
+    samples = {}
+    for line in folded.splitlines():
+        stack, count = line.rsplit(' ', 1)
+        samples[stack] = int(count)
+
+    return samples
+
+
+def attach_profile(
+        span: Span,
+        samples: Dict[str, int],
+        interval_ms: float,
+        max_bytes: Optional[int] = DEFAULT_PROFILE_MAX_BYTES,
+):
+    """
+    Attach the folded profile to the span, if there are no samples nothing is attached.
+    The stacks that do not fit in max_bytes are counted in profile.truncated_stacks.
+    :param span: The span of the profiled transaction.
+    :param samples: The number of samples by folded stack.
+    :param interval_ms: The sampling interval.
+    :param max_bytes: The maximum length of the encoded profile.
+    :return: None
+    """
+    if not samples:
+        return
+
+    encoded, stacks = fit_folded_profile(samples, max_bytes=max_bytes)
+    span.set_attributes({
+        'profile.samples': sum(samples.values()),
+        'profile.interval_ms': interval_ms,
+        'profile.folded': encoded,
+        'profile.truncated_stacks': len(samples) - stacks,
+    })
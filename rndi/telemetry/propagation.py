@@ -0,0 +1,92 @@
+#
+# This file is part of the Ingram Micro CloudBlue RnD Integration Connectors SDK.
+#
+# Copyright (c) 2023 Ingram Micro. All Rights Reserved.
+#
+from typing import Any, List, Mapping, MutableMapping, Optional
+
+from opentelemetry import trace
+from opentelemetry.context import Context
+from opentelemetry.propagators.textmap import Getter
+from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
+
+TRACEPARENT = 'traceparent'
+
+# the request fields that may hold a carrier: HTTP headers or task queue message metadata.
+CARRIER_FIELDS = ('headers', 'metadata')
+
+propagator = TraceContextTextMapPropagator()
+
+
+class CaseInsensitiveGetter(Getter[Mapping[str, Any]]):
+    """
+    Carrier getter that ignores the case of the keys, HTTP headers usually come as
+    'Traceparent' or 'TRACEPARENT'.
+    """
+
+    def get(self, carrier: Mapping[str, Any], key: str) -> Optional[List[str]]:
+        value = carrier.get(key)
+        if value is None:
+            for name, candidate in carrier.items():
+                if isinstance(name, str) and name.lower() == key:
+                    value = candidate
+                    break
+
+        if value is None:
+            return None
+
+        return list(value) if isinstance(value, (list, tuple)) else [str(value)]
+
+    def keys(self, carrier: Mapping[str, Any]) -> List[str]:
+        return list(carrier.keys())
+
+
+getter = CaseInsensitiveGetter()
+
+
+def _has_traceparent(carrier: Mapping[str, Any]) -> bool:
+    return TRACEPARENT in carrier or any(
+        isinstance(name, str) and name.lower() == TRACEPARENT for name in carrier.keys()
+    )
+
+
+def find_carrier(request: Mapping[str, Any]) -> Optional[Mapping[str, Any]]:
+    """
+    Find the carrier of the W3C trace context in a request, it can be the request itself
+    (Connect request fields) or one of its headers or metadata fields.
+    :param request: The request.
+    :return: The carrier or None if the request does not carry a trace context.
+    """
+    if TRACEPARENT in request:
+        return request
+
+    for field in CARRIER_FIELDS:
+        carrier = request.get(field)
+        if isinstance(carrier, Mapping) and _has_traceparent(carrier):
+            return carrier
+
+    return None
+
+
+def extract_context(carrier: Mapping[str, Any]) -> Optional[Context]:
+    """
+    Extract the trace context from a traceparent/tracestate carrier.
+    :param carrier: The carrier.
+    :return: The context holding the remote span, or None if the carrier is not valid.
+    """
+    context = propagator.extract(carrier, getter=getter)
+    if not trace.get_current_span(context).get_span_context().is_valid:
+        return None
+
+    return context
+
+
+def inject_context(carrier: MutableMapping[str, str], context: Optional[Context] = None) -> MutableMapping[str, str]:
+    """
+    Inject the traceparent/tracestate of the current (or given) span in the carrier.
+    :param carrier: The carrier, HTTP headers, task queue message metadata or request fields.
+    :param context: The context to inject, the current one by default.
+    :return: The carrier.
+    """
+    propagator.inject(carrier, context=context)
+    return carrier
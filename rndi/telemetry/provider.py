@@ -8,7 +8,9 @@ from typing import Callable, Dict, List, Optional
 
 from rndi.telemetry.adapters.azure import provide_azure_insights_observer_telemetry_adapter
 from rndi.telemetry.adapters.null import provide_none_telemetry_adapter
+from rndi.telemetry.config import get_number
 from rndi.telemetry.contracts import Observer
+from rndi.telemetry.stats import start_stats_reporter
 
 
 def provide_telemetry_observer(
@@ -43,4 +45,8 @@ def provide_telemetry_observer(
             f"Telemetry Observer failure, disabling observability with driver {driver} due to: {e}",
         )
 
+    stats_log_interval = get_number(config, 'TELEMETRY_STATS_LOG_INTERVAL_SECONDS', None, float)
+    if stats_log_interval:
+        adapter.stats_reporter = start_stats_reporter(adapter.stats, logger, stats_log_interval)
+
     return adapter
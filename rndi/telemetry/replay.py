@@ -0,0 +1,417 @@
+#
+# This file is part of the Ingram Micro CloudBlue RnD Integration Connectors SDK.
+#
+# Copyright (c) 2023 Ingram Micro. All Rights Reserved.
+#
+"""
+Offline replay harness: stream a JSON lines corpus of captured Connect requests (asset,
+tier config, product action and custom event requests) through the telemetry observer and
+report the throughput, the per trace overhead and the memory usage.
+
+    python -m rndi.telemetry.replay requests.jsonl --concurrency 8 --mode threads
+"""
+import argparse
+import json
+import math
+import sys
+import tracemalloc
+import typing
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from logging import getLogger, LoggerAdapter
+from queue import Queue
+from threading import Thread
+from time import perf_counter, perf_counter_ns
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO
+
+from opentelemetry import trace
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from rndi.telemetry.adapters.azure import provide_azure_insights_observer_telemetry_adapter
+from rndi.telemetry.contracts import Observer
+from rndi.telemetry.provider import provide_telemetry_observer
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+# the observer modules whose live allocations are reported with tracemalloc.
+TRACED_MODULES = ('opentelemetry', 'rndi/telemetry', 'rndi\\telemetry')
+
+
+class NullSpanExporter(SpanExporter):
+    """
+    Span exporter that only counts the exported spans.
+    """
+
+    def __init__(self):
+        self.exported = 0
+
+    def export(self, spans: typing.Sequence[ReadableSpan]) -> SpanExportResult:
+        self.exported += len(spans)
+        return SpanExportResult.SUCCESS
+
+
+class LatencyHistogram:
+    """
+    Log-linear histogram of latencies in nanoseconds with a ~4% precision, so the
+    percentiles of any number of traces can be computed in constant memory.
+    """
+    RESOLUTION = 16
+
+    def __init__(self):
+        self.buckets: Counter = Counter()
+        self.count = 0
+
+    def add(self, nanoseconds: int):
+        self.buckets[int(math.log2(max(nanoseconds, 1)) * self.RESOLUTION)] += 1
+        self.count += 1
+
+    def merge(self, other: 'LatencyHistogram'):
+        self.buckets.update(other.buckets)
+        self.count += other.count
+
+    def percentile(self, percentile: float) -> float:
+        """
+        Get the upper bound of the bucket holding the given percentile.
+        :param percentile: The percentile, between 0 and 100.
+        :return: The latency in nanoseconds.
+        """
+        if self.count == 0:
+            return 0.0
+
+        rank = math.ceil(self.count * percentile / 100)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return 2 ** ((bucket + 1) / self.RESOLUTION)
+
+        return 0.0  # pragma: no cover
+
+
+def read_corpus(
+        file: TextIO,
+        limit: Optional[int] = None,
+        on_skipped: Optional[Callable[[int], None]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Stream the requests of a JSON lines corpus, the file is never fully loaded. The lines
+    that are not a JSON object are skipped, so a truncated or corrupted line does not abort
+    the replay of a long capture.
+    :param file: The opened corpus.
+    :param limit: The maximum number of requests to read.
+    :param on_skipped: Called with the number of each skipped line, nothing is kept in memory.
+    :return: An iterator of requests.
+    """
+    count = 0
+    for number, line in enumerate(file, start=1):
+        if limit is not None and count >= limit:
+            return
+
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            request = json.loads(line)
+        except ValueError:
+            request = None
+
+        if not isinstance(request, dict):
+            if on_skipped is not None:
+                on_skipped(number)
+            continue
+
+        yield request
+        count += 1
+
+
+def provide_replay_observer(config: Dict[str, Any], exporter: SpanExporter) -> Observer:
+    """
+    Provide the observer through provide_telemetry_observer, exporting to the given exporter.
+    """
+    config = dict(config, TELEMETRY_DRIVER='replay')
+    config.setdefault('TELEMETRY_SERVICE_NAME', 'rndi-telemetry-replay')
+
+    return provide_telemetry_observer(
+        config,
+        LoggerAdapter(getLogger('rndi.telemetry.replay'), {}),
+        {
+            'replay': lambda replay_config, instrumentation: provide_azure_insights_observer_telemetry_adapter(
+                replay_config,
+                instrumentation,
+                exporter,
+            ),
+        },
+    )
+
+
+def provide_exporter(name: str) -> SpanExporter:
+    return InMemorySpanExporter() if name == 'memory' else NullSpanExporter()
+
+
+def replay(
+        observer: Observer,
+        requests: Iterable[Dict[str, Any]],
+        name: str = 'replay',
+        technical: int = 1,
+) -> LatencyHistogram:
+    """
+    Trace each request as a Business Transaction with the given number of nested Technical
+    Transactions, measuring the overhead of each trace.
+    :param observer: The observer.
+    :param requests: The requests to replay.
+    :param name: The name of the Business Transaction spans.
+    :param technical: The number of Technical Transactions traced in each Business Transaction.
+    :return: The histogram of the per trace overhead.
+    """
+    histogram = LatencyHistogram()
+    for request in requests:
+        started = perf_counter_ns()
+        with observer.trace(name, request):
+            for _ in range(technical):
+                with observer.trace(f"{name}.technical", request):
+                    pass
+        histogram.add(perf_counter_ns() - started)
+
+    return histogram
+
+
+def _queued(queue: Queue) -> Iterator[Dict[str, Any]]:
+    while True:
+        request = queue.get()
+        if request is None:
+            return
+        yield request
+
+
+def replay_with_threads(
+        observer: Observer,
+        requests: Iterable[Dict[str, Any]],
+        concurrency: int,
+        name: str = 'replay',
+        technical: int = 1,
+) -> LatencyHistogram:
+    """
+    Replay the requests with a pool of threads sharing the observer, the requests are handed
+    over through a bounded queue, so the corpus is streamed.
+    """
+    queue: Queue = Queue(maxsize=concurrency * 64)
+    histograms: List[LatencyHistogram] = []
+    errors: List[Exception] = []
+
+    def _work():
+        try:
+            histograms.append(replay(observer, _queued(queue), name, technical))
+        except Exception as error:
+            errors.append(error)
+            # keep consuming, so the producer is never blocked by a full queue.
+            for _ in _queued(queue):
+                pass
+
+    workers = [Thread(target=_work, name=f"replay-{i}", daemon=True) for i in range(concurrency)]
+    for worker in workers:
+        worker.start()
+
+    try:
+        for request in requests:
+            queue.put(request)
+    finally:
+        for _ in workers:
+            queue.put(None)
+        for worker in workers:
+            worker.join()
+
+    if errors:
+        raise errors[0]
+
+    histogram = LatencyHistogram()
+    for partial in histograms:
+        histogram.merge(partial)
+
+    return histogram
+
+
+_process_observer: Optional[Observer] = None
+
+
+def _initialize_process(config: Dict[str, Any], exporter: str, memory: bool):
+    global _process_observer
+    if memory:
+        tracemalloc.start()
+    _process_observer = provide_replay_observer(config, provide_exporter(exporter))
+
+
+def _replay_chunk(chunk: List[Dict[str, Any]], name: str, technical: int) -> Dict[str, Any]:
+    histogram = replay(_process_observer, chunk, name, technical)
+    trace.get_tracer_provider().force_flush()
+    return {'histogram': histogram, 'memory': memory_report()}
+
+
+def _chunks(requests: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    chunk = []
+    for request in requests:
+        chunk.append(request)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def replay_with_processes(
+        config: Dict[str, Any],
+        requests: Iterable[Dict[str, Any]],
+        concurrency: int,
+        exporter: str = 'null',
+        name: str = 'replay',
+        technical: int = 1,
+        memory: bool = False,
+        chunk_size: int = 256,
+) -> typing.Tuple[LatencyHistogram, Dict[str, int]]:
+    """
+    Replay the requests with a pool of processes, each one with its own observer. The
+    requests are sent in chunks with a bounded number of chunks in flight, so the corpus
+    is streamed.
+    """
+    histogram = LatencyHistogram()
+    memory_peak: Dict[str, int] = {}
+
+    def _collect(futures):
+        for future in futures:
+            result = future.result()
+            histogram.merge(result['histogram'])
+            for key, value in result['memory'].items():
+                memory_peak[key] = max(memory_peak.get(key, 0), value)
+
+    with ProcessPoolExecutor(
+            max_workers=concurrency,
+            initializer=_initialize_process,
+            initargs=(config, exporter, memory),
+    ) as executor:
+        pending = set()
+        for chunk in _chunks(requests, chunk_size):
+            if len(pending) >= concurrency * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                _collect(done)
+            pending.add(executor.submit(_replay_chunk, chunk, name, technical))
+
+        _collect(wait(pending).done)
+
+    return histogram, memory_peak
+
+
+def memory_report() -> Dict[str, int]:
+    """
+    Report the peak RSS of the process (and its children) and, if tracemalloc is tracing,
+    the traced memory and the live allocations of the observer modules.
+    """
+    report = {}
+    if resource is not None:
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+        scale = 1 if sys.platform == 'darwin' else 1024
+        report['peak_rss_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+        children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+        if children:
+            report['peak_children_rss_bytes'] = children
+
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        statistics = tracemalloc.take_snapshot().statistics('filename')
+        report['traced_current_bytes'] = current
+        report['traced_peak_bytes'] = peak
+        report['allocated_blocks'] = sum(statistic.count for statistic in statistics)
+        report['observer_allocated_blocks'] = sum(
+            statistic.count for statistic in statistics
+            if any(module in statistic.traceback[0].filename for module in TRACED_MODULES)
+        )
+
+    return report
+
+
+def _parse_config(values: List[str]) -> Dict[str, str]:
+    config = {}
+    for value in values:
+        key, _, setting = value.partition('=')
+        config[key] = setting
+
+    return config
+
+
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not greater than 0")
+
+    return number
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('corpus', help="JSON lines file with one request per line, '-' to read from stdin")
+    parser.add_argument('--concurrency', type=_positive_int, default=1, help='number of threads or processes')
+    parser.add_argument('--mode', choices=('threads', 'processes'), default='threads')
+    parser.add_argument(
+        '--exporter',
+        choices=('null', 'memory'),
+        default='null',
+        help='the memory exporter keeps every span, use it with small corpora',
+    )
+    parser.add_argument('--name', default='replay', help='name of the business transaction spans')
+    parser.add_argument('--technical', type=int, default=1, help='technical transactions per request')
+    parser.add_argument('--limit', type=int, default=None, help='maximum number of requests to replay')
+    parser.add_argument('--tracemalloc', action='store_true', help='report the tracemalloc allocations')
+    parser.add_argument(
+        '--config',
+        action='append',
+        default=[],
+        metavar='KEY=VALUE',
+        help='observer configuration, e.g. TELEMETRY_PGSQL_COALESCING=true',
+    )
+    args = parser.parse_args(argv)
+    config = _parse_config(args.config)
+
+    corpus = sys.stdin if args.corpus == '-' else open(args.corpus, encoding='utf-8')
+    skipped = 0
+
+    def _skip(_: int) -> None:
+        nonlocal skipped
+        skipped += 1
+
+    try:
+        requests = read_corpus(corpus, args.limit, _skip)
+        started = perf_counter()
+        if args.mode == 'processes':
+            histogram, memory = replay_with_processes(
+                config, requests, args.concurrency, args.exporter, args.name, args.technical, args.tracemalloc,
+            )
+        else:
+            if args.tracemalloc:
+                tracemalloc.start()
+            observer = provide_replay_observer(config, provide_exporter(args.exporter))
+            histogram = replay_with_threads(observer, requests, args.concurrency, args.name, args.technical)
+            trace.get_tracer_provider().force_flush()
+            memory = memory_report()
+        elapsed = perf_counter() - started
+    finally:
+        if corpus is not sys.stdin:
+            corpus.close()
+
+    print(f"requests          {histogram.count}")
+    print(f"skipped lines     {skipped}")
+    print(f"elapsed           {elapsed:.3f} s")
+    print(f"requests/sec      {histogram.count / elapsed if elapsed else 0:,.1f}")
+    print(f"p50 overhead      {histogram.percentile(50) / 1000:,.1f} us")
+    print(f"p99 overhead      {histogram.percentile(99) / 1000:,.1f} us")
+    for key, value in memory.items():
+        print(f"{key:<26}{value:,}")
+
+    return 0
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main())
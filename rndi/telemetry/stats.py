@@ -0,0 +1,194 @@
+#
+# This file is part of the Ingram Micro CloudBlue RnD Integration Connectors SDK.
+#
+# Copyright (c) 2023 Ingram Micro. All Rights Reserved.
+#
+from logging import LoggerAdapter
+from threading import Event, local, Lock, Thread
+from time import perf_counter_ns
+from typing import Any, Callable, Dict, List, Optional
+
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor
+
+
+class _Timer:
+    __slots__ = ('stats', 'name', 'started')
+
+    def __init__(self, stats: 'ObserverStats', name: str):
+        self.stats = stats
+        self.name = name
+        self.started = 0
+
+    def __enter__(self):
+        self.started = perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stats.record(self.name, perf_counter_ns() - self.started)
+
+
+class _NoneTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+NONE_TIMER = _NoneTimer()
+
+
+class ObserverStats:
+    """
+    Cheap monotonic counters to measure the overhead added by the observer itself in its
+    hot paths. When disabled, the timers are a shared no-op context manager.
+    Each thread updates its own counters without any lock, so the stats do not add the
+    contention they measure, the counters of every thread are merged on snapshot.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        # one name => [count, total_ns, max_ns] dictionary by thread.
+        self._shards: List[Dict[str, List[int]]] = []
+        self._local = local()
+        self._lock = Lock()
+
+    def timed(self, name: str):
+        """
+        Measure the time spent in the with block under the given name.
+        :param name: The name of the counter.
+        :return: A context manager.
+        """
+        if not self.enabled:
+            return NONE_TIMER
+
+        return _Timer(self, name)
+
+    def record(self, name: str, elapsed_ns: int = 0):
+        """
+        Record an occurrence of the given counter.
+        :param name: The name of the counter.
+        :param elapsed_ns: The elapsed time of the occurrence in nanoseconds.
+        :return: None
+        """
+        if not self.enabled:
+            return
+
+        counters = self._counters()
+        counter = counters.get(name)
+        if counter is None:
+            counters[name] = [1, elapsed_ns, elapsed_ns]
+            return
+        counter[0] += 1
+        counter[1] += elapsed_ns
+        if elapsed_ns > counter[2]:
+            counter[2] = elapsed_ns
+
+    def add(self, name: str, amount: int = 1):
+        """
+        Add the given amount to the count of a counter that does not measure time, like the
+        number of truncated spans.
+        :param name: The name of the counter.
+        :param amount: The amount to add.
+        :return: None
+        """
+        if not self.enabled:
+            return
+
+        counters = self._counters()
+        counter = counters.get(name)
+        if counter is None:
+            counters[name] = [amount, 0, 0]
+            return
+        counter[0] += amount
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the current value of the counters merged from every thread.
+        :return: The count, total and max time in milliseconds by counter name.
+        """
+        with self._lock:
+            shards = list(self._shards)
+
+        counters: Dict[str, List[int]] = {}
+        for shard in shards:
+            # the copy is atomic, the other threads keep updating their own counters.
+            for name, (count, total, maximum) in shard.copy().items():
+                merged = counters.setdefault(name, [0, 0, 0])
+                merged[0] += count
+                merged[1] += total
+                merged[2] = max(merged[2], maximum)
+
+        return {
+            name: {
+                'count': count,
+                'total_ms': total / 1e6,
+                'max_ms': maximum / 1e6,
+            } for name, (count, total, maximum) in counters.items()
+        }
+
+    def reset(self):
+        with self._lock:
+            for shard in self._shards:
+                shard.clear()
+
+    def _counters(self) -> Dict[str, List[int]]:
+        counters = getattr(self._local, 'counters', None)
+        if counters is None:
+            counters = self._local.counters = {}
+            with self._lock:
+                self._shards.append(counters)
+
+        return counters
+
+
+class MeasuredSpanProcessor(SpanProcessor):
+    """
+    Span processor that measures the time spent by the delegated processor on each span
+    start and end, for the BatchSpanProcessor the end is the enqueue of the span.
+    """
+
+    def __init__(self, delegate: SpanProcessor, stats: ObserverStats):
+        self.delegate = delegate
+        self.stats = stats
+
+    def on_start(self, span: Span, parent_context: Optional[Context] = None) -> None:
+        with self.stats.timed('processor.on_start'):
+            self.delegate.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        with self.stats.timed('processor.on_end'):
+            self.delegate.on_end(span)
+
+    def shutdown(self) -> None:
+        self.delegate.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.delegate.force_flush(timeout_millis)
+
+
+def start_stats_reporter(
+        stats: Callable[[], Dict[str, Any]],
+        logger: LoggerAdapter,
+        interval_seconds: float,
+) -> Event:
+    """
+    Periodically log the observer stats using the given logger.
+    :param stats: The callable returning the stats, usually the observer stats method.
+    :param logger: The logger.
+    :param interval_seconds: The seconds between log lines.
+    :return: The event to set to stop the reporter.
+    """
+    stopped = Event()
+
+    def _report():
+        while not stopped.wait(interval_seconds):
+            snapshot = stats()
+            if snapshot:
+                logger.info(f"Telemetry Observer stats: {snapshot}")
+
+    Thread(target=_report, name='rndi-telemetry-stats', daemon=True).start()
+    return stopped
@@ -1,8 +1,10 @@
 import typing
 
 import pytest
-from opentelemetry.sdk.trace import ReadableSpan
-from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace import ReadableSpan, sampling, TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from rndi.telemetry.adapters.azure import DevOpsExtensionAzureInsightsObserverAdapter
 
 
 @pytest.fixture
@@ -14,3 +16,19 @@ def mocked_span_exporter():
             pass
 
     return MockedSpanExporter()
+
+
+@pytest.fixture
+def in_memory_tracer():
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider(sampler=sampling.ALWAYS_ON)
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+
+    return provider.get_tracer('test'), exporter
+
+
+@pytest.fixture
+def in_memory_adapter(in_memory_tracer):
+    tracer, exporter = in_memory_tracer
+
+    return DevOpsExtensionAzureInsightsObserverAdapter('fake-connection-string', tracer), exporter
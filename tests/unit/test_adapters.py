@@ -3,10 +3,16 @@
 #
 # Copyright (c) 2023 Ingram Micro. All Rights Reserved.
 #
+import threading
+from unittest.mock import Mock
+
+import pytest
 from opentelemetry import trace
 from opentelemetry.context import Context
+from opentelemetry.trace import StatusCode
 from rndi.telemetry.adapters.azure import DevOpsExtensionAzureInsightsObserverAdapter, generate_trace_id, get_context
 from rndi.telemetry.adapters.null import NoneObserverAdapter
+from rndi.telemetry.stats import ObserverStats
 
 
 def test_none_observer_adapter_should_do_nothing():
@@ -172,3 +178,250 @@ def test_insights_adapter_should_run_automatic_instrumentation_if_provided():
             __some_instrumentation,
         ],
     )
+
+
+def test_insights_adapter_should_dump_the_flight_recorder_on_business_transaction_failure():
+    flight_recorder = Mock()
+    adapter = DevOpsExtensionAzureInsightsObserverAdapter(
+        'fake-connection-string',
+        trace.get_tracer('TELEMETRY_SERVICE_NAME'),
+        flight_recorder=flight_recorder,
+    )
+
+    with pytest.raises(ValueError):
+        with adapter.trace('custom_event_parent_trace', {'body': {'key': 'value'}}):
+            raise ValueError('Something went wrong')
+
+    flight_recorder.request_dump.assert_called_once_with('failure')
+
+
+def test_insights_adapter_should_not_break_if_the_flight_recorder_dump_fails():
+    flight_recorder = Mock()
+    flight_recorder.request_dump.side_effect = RuntimeError("can't start new thread")
+    adapter = DevOpsExtensionAzureInsightsObserverAdapter(
+        'fake-connection-string',
+        trace.get_tracer('TELEMETRY_SERVICE_NAME'),
+        flight_recorder=flight_recorder,
+    )
+
+    adapter.dump_flight_recorder()
+
+    flight_recorder.request_dump.assert_called_once_with('manual')
+
+
+def test_insights_adapter_should_expose_the_overhead_stats():
+    adapter = DevOpsExtensionAzureInsightsObserverAdapter(
+        'fake-connection-string',
+        trace.get_tracer('TELEMETRY_SERVICE_NAME'),
+        counters=ObserverStats(enabled=True),
+    )
+
+    with adapter.trace('custom_event_parent_trace', {'body': {'key': 'value'}}):
+        with adapter.trace('custom_event_nested_technical_transaction', {'body': {'key': 'value'}}):
+            pass
+
+    stats = adapter.stats()
+    assert stats['classification']['count'] == 1
+    assert stats['context']['count'] == 1
+    assert stats['hydration']['count'] == 1
+    assert stats['span.start']['count'] == 2
+    assert stats['span.end']['count'] == 2
+
+
+def test_none_observer_adapter_should_not_have_stats():
+    assert NoneObserverAdapter().stats() == {}
+
+
+def test_insights_adapter_should_continue_the_trace_of_the_carrier_on_business_transactions(in_memory_adapter):
+    adapter, exporter = in_memory_adapter
+
+    with adapter.trace('custom_event_parent_trace', {
+        'body': {'key': 'value'},
+        'headers': {'Traceparent': '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01'},
+    }):
+        carrier = adapter.inject({})
+
+    span = exporter.get_finished_spans()[0]
+    assert span.context.trace_id == 0x0af7651916cd43dd8448eb211c80319c
+    assert span.parent.span_id == 0xb7ad6b7169203331
+    assert carrier['traceparent'] == f"00-0af7651916cd43dd8448eb211c80319c-{span.context.span_id:016x}-01"
+    assert adapter.extract(carrier) is not None
+
+
+def test_insights_adapter_should_derive_the_trace_from_the_request_without_carrier(in_memory_adapter):
+    adapter, exporter = in_memory_adapter
+
+    with adapter.trace('custom_event_parent_trace', {'body': {'key': 'value'}}):
+        pass
+
+    span = exporter.get_finished_spans()[0]
+    assert span.context.trace_id == generate_trace_id({'key': 'value'}.__str__())
+
+
+def test_none_observer_adapter_should_not_propagate_the_trace_context():
+    observer = NoneObserverAdapter()
+
+    assert observer.inject({}) == {}
+    assert observer.extract({'traceparent': '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01'}) is None
+
+
+def test_insights_adapter_should_trace_batches_of_requests(in_memory_adapter):
+    adapter, exporter = in_memory_adapter
+
+    requests = [
+        {'body': {'first-key': 'first-value'}},
+        {'unknown': 'format'},
+        {'jwt_payload': {'asset_id': 'AS-1234'}},
+    ]
+    with adapter.trace_batch('scheduler.page', requests, 'asset.process') as items:
+        processed = []
+        for request, _ in items:
+            processed.append(request)
+            with adapter.trace('technical_transaction', request):
+                pass
+
+    assert processed == requests
+    assert adapter.business_transaction is None
+
+    batch = next(span for span in exporter.get_finished_spans() if span.name == 'scheduler.page')
+    items = [span for span in exporter.get_finished_spans() if span.name == 'asset.process']
+    technical = [span for span in exporter.get_finished_spans() if span.name == 'technical_transaction']
+
+    assert batch.parent is None
+    assert batch.attributes['batch.size'] == 3
+    assert [link.context.trace_id for link in batch.links] == [
+        generate_trace_id({'first-key': 'first-value'}.__str__()),
+        generate_trace_id('AS-1234'),
+    ]
+    assert [span.context.trace_id for span in items] == [link.context.trace_id for link in batch.links]
+    assert all(span.links[0].context.span_id == batch.context.span_id for span in items)
+    assert items[1].attributes['asset_id'] == 'AS-1234'
+    assert [span.parent.span_id for span in technical] == [items[0].context.span_id, items[1].context.span_id]
+
+
+def test_insights_adapter_should_split_the_links_of_large_batches(in_memory_adapter):
+    adapter, exporter = in_memory_adapter
+
+    requests = [{'body': {'key': f"value-{i}"}} for i in range(300)]
+    with adapter.trace_batch('scheduler.page', requests, 'asset.process') as items:
+        for _ in items:
+            pass
+
+    spans = exporter.get_finished_spans()
+    batch = next(span for span in spans if span.name == 'scheduler.page')
+    children = [span for span in spans if span.name == 'scheduler.page.links']
+
+    assert batch.attributes['batch.linked'] == 300
+    assert [len(span.links) for span in [batch] + children] == [100, 100, 100]
+    assert all(span.dropped_links == 0 for span in [batch] + children)
+    assert all(span.parent.span_id == batch.context.span_id for span in children)
+    assert [link.context.trace_id for span in [batch] + children for link in span.links] == [
+        generate_trace_id(request['body'].__str__()) for request in requests
+    ]
+
+
+@pytest.mark.parametrize('requests', [
+    [{'unknown': 'format'}, {'body': {'first-key': 'first-value'}}],
+    [{'body': {'first-key': 'first-value'}}, {'unknown': 'format'}],
+])
+def test_insights_adapter_should_not_trace_unknown_batch_items_wherever_they_are(requests, in_memory_adapter):
+    adapter, exporter = in_memory_adapter
+
+    with adapter.trace_batch('scheduler.page', requests, 'asset.process') as items:
+        for request, span in items:
+            assert (span is None) == ('unknown' in request)
+            with adapter.trace('technical_transaction', request) as technical:
+                assert (technical is None) == ('unknown' in request)
+
+    assert sorted(span.name for span in exporter.get_finished_spans()) == [
+        'asset.process',
+        'scheduler.page',
+        'technical_transaction',
+    ]
+
+
+def test_insights_adapter_should_record_the_batch_loop_failures_on_the_current_item(in_memory_tracer):
+    tracer, exporter = in_memory_tracer
+    flight_recorder = Mock()
+    adapter = DevOpsExtensionAzureInsightsObserverAdapter(
+        'fake-connection-string',
+        tracer,
+        flight_recorder=flight_recorder,
+    )
+
+    requests = [{'body': {'first-key': 'first-value'}}, {'body': {'second-key': 'second-value'}}]
+    with pytest.raises(ValueError):
+        with adapter.trace_batch('scheduler.page', requests, 'asset.process') as items:
+            for request, _ in items:
+                if 'second-key' in request['body']:
+                    raise ValueError('Something went wrong')
+
+    first, second = [span for span in exporter.get_finished_spans() if span.name == 'asset.process']
+    assert first.status.status_code == StatusCode.UNSET
+    assert second.status.status_code == StatusCode.ERROR
+    assert [event.name for event in second.events] == ['exception']
+    assert adapter.business_transaction is None
+    flight_recorder.request_dump.assert_called_once_with('failure')
+
+
+def test_insights_adapter_should_scope_the_business_transaction_to_the_current_thread(in_memory_adapter):
+    adapter, exporter = in_memory_adapter
+
+    def _work():
+        with adapter.trace('other_thread', {'body': {'second-key': 'second-value'}}):
+            pass
+
+    with adapter.trace('custom_event_parent_trace', {'body': {'first-key': 'first-value'}}):
+        thread = threading.Thread(target=_work)
+        thread.start()
+        thread.join()
+    assert adapter.business_transaction is None
+
+    with adapter.trace('next_business_transaction', {'body': {'third-key': 'third-value'}}):
+        pass
+
+    spans = {span.name: span for span in exporter.get_finished_spans()}
+    assert spans['other_thread'].context.trace_id == generate_trace_id({'second-key': 'second-value'}.__str__())
+    assert spans['next_business_transaction'].context.trace_id == generate_trace_id(
+        {'third-key': 'third-value'}.__str__(),
+    )
+
+
+def test_none_observer_adapter_should_trace_batches_of_requests():
+    observer = NoneObserverAdapter()
+
+    with observer.trace_batch('scheduler.page', [{'id': 'PR-1'}, {'id': 'PR-2'}]) as items:
+        assert list(items) == [({'id': 'PR-1'}, None), ({'id': 'PR-2'}, None)]
+
+
+def test_insights_adapter_should_trace_decorated_functions(in_memory_adapter):
+    adapter, exporter = in_memory_adapter
+
+    @adapter.traced('custom_event_parent_trace')
+    def process(request: dict):
+        return trace.get_current_span()
+
+    span = process({'body': {'key': 'value'}})
+
+    assert exporter.get_finished_spans()[0].context.span_id == span.get_span_context().span_id
+    assert span.get_span_context().trace_id == generate_trace_id({'key': 'value'}.__str__())
+
+
+def test_insights_adapter_should_not_nest_the_consumer_traces_in_suspended_generators(in_memory_adapter):
+    adapter, exporter = in_memory_adapter
+
+    @adapter.traced('asset.list')
+    def assets(request: dict):
+        for i in range(2):
+            yield i
+
+    for i in assets({'body': {'key': 'value'}}):
+        with adapter.trace('unrelated', {'body': {'index': i}}):
+            pass
+
+    spans = exporter.get_finished_spans()
+    assert [span.name for span in spans] == ['unrelated', 'unrelated', 'asset.list']
+    assert [span.context.trace_id for span in spans[:2]] == [
+        generate_trace_id({'index': 0}.__str__()),
+        generate_trace_id({'index': 1}.__str__()),
+    ]
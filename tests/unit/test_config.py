@@ -0,0 +1,29 @@
+#
+# This file is part of the Ingram Micro CloudBlue RnD Integration Connectors SDK.
+#
+# Copyright (c) 2023 Ingram Micro. All Rights Reserved.
+#
+import pytest
+from rndi.telemetry.config import get_list, get_mapping
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('250, 50,', [250.0, 50.0]),
+    ([100, '200'], [100.0, 200.0]),
+    ('', [1.0]),
+    ('50,fast', [1.0]),
+    (42, [1.0]),
+])
+def test_get_list_should_cast_each_item_or_return_the_default(value, expected):
+    assert get_list({'KEY': value}, 'KEY', [1.0], float) == expected
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('{"^SUB-\\\\d+$": "{subscription}"}', {'^SUB-\\d+$': '{subscription}'}),
+    ({'a': 'b'}, {'a': 'b'}),
+    ('{invalid', None),
+    ('["a"]', None),
+    ('', None),
+])
+def test_get_mapping_should_parse_json_objects_or_return_the_default(value, expected):
+    assert get_mapping({'KEY': value}, 'KEY') == expected
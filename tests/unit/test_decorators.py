@@ -0,0 +1,180 @@
+#
+# This file is part of the Ingram Micro CloudBlue RnD Integration Connectors SDK.
+#
+# Copyright (c) 2023 Ingram Micro. All Rights Reserved.
+#
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict
+
+import pytest
+from rndi.telemetry.adapters.null import NoneObserverAdapter
+from rndi.telemetry.contracts import Observer
+
+REQUEST = {'id': 'PR-0000-0000-0000-001'}
+
+
+class RecordingObserver(Observer):
+    def __init__(self):
+        self.traces = []
+        self._active: ContextVar[bool] = ContextVar('active', default=False)
+
+    @property
+    def active(self) -> bool:
+        return self._active.get()
+
+    @contextmanager
+    def trace(self, name: str, context: Dict[str, Any]):
+        self.traces.append((name, context))
+        token = self._active.set(True)
+        try:
+            yield
+        finally:
+            # as the opentelemetry context detach, it fails if it is not done in the context of the set.
+            self._active.reset(token)
+
+
+def test_traced_should_trace_functions_with_the_context_argument():
+    observer = RecordingObserver()
+
+    @observer.traced('asset.process.purchase')
+    def process(flow: str, request: dict) -> bool:
+        return observer.active
+
+    assert process('flow', REQUEST)
+    assert process('flow', request=REQUEST)
+    assert not observer.active
+    assert observer.traces == [('asset.process.purchase', REQUEST), ('asset.process.purchase', REQUEST)]
+    assert process.__name__ == 'process'
+
+
+def test_traced_should_trace_functions_with_the_context_in_a_given_position():
+    observer = RecordingObserver()
+
+    @observer.traced('asset.process.purchase', 1)
+    def process(_: str, payload: dict) -> dict:
+        return payload
+
+    assert process('flow', REQUEST) == REQUEST
+    assert process('flow', payload=REQUEST) == REQUEST
+    assert observer.traces == [('asset.process.purchase', REQUEST), ('asset.process.purchase', REQUEST)]
+
+
+def test_traced_should_find_keyword_only_and_variadic_context_arguments():
+    observer = RecordingObserver()
+
+    @observer.traced('asset.process.purchase')
+    def process(*flows: str, request: dict):
+        """Nothing to do."""
+
+    @observer.traced('asset.process.purchase', 1)
+    def process_all(*requests: dict):
+        """Nothing to do."""
+
+    process('first', 'second', request=REQUEST)
+    process_all('flow', REQUEST)
+    assert observer.traces == [('asset.process.purchase', REQUEST), ('asset.process.purchase', REQUEST)]
+
+
+def test_traced_should_fail_on_decoration_if_the_context_argument_does_not_exist():
+    observer = RecordingObserver()
+
+    with pytest.raises(ValueError):
+        @observer.traced('asset.process.purchase', 'request')
+        def process(payload: dict):
+            """Nothing to do."""
+
+
+def test_traced_should_trace_the_whole_iteration_of_generators():
+    observer = RecordingObserver()
+
+    @observer.traced('asset.list')
+    def assets(request: dict):
+        for i in range(3):
+            yield i, observer.active
+
+    assert list(assets(REQUEST)) == [(0, True), (1, True), (2, True)]
+    assert not observer.active
+    assert observer.traces == [('asset.list', REQUEST)]
+
+
+def test_traced_should_not_leak_the_trace_of_suspended_generators():
+    observer = RecordingObserver()
+
+    @observer.traced('asset.list')
+    def assets(request: dict):
+        for i in range(3):
+            yield i, observer.active
+
+    consumed = []
+    for i, active in assets(REQUEST):
+        consumed.append((i, active, observer.active))
+        if i == 1:
+            break
+
+    assert consumed == [(0, True, False), (1, True, False)]
+    assert observer.traces == [('asset.list', REQUEST)]
+
+
+def test_traced_should_close_async_generators_from_another_task():
+    observer = RecordingObserver()
+    closed = []
+
+    @observer.traced('asset.list')
+    async def assets(request: dict):
+        try:
+            for i in range(3):
+                await asyncio.sleep(0)
+                yield i, observer.active
+        finally:
+            closed.append(observer.active)
+
+    async def _break_early():
+        generator = assets(REQUEST)
+        consumed = []
+        async for i, active in generator:
+            consumed.append((i, active, observer.active))
+            break
+        # closed from another task, as the event loop does when it finalizes the generator.
+        await asyncio.get_running_loop().create_task(generator.aclose())
+        return consumed
+
+    assert asyncio.run(_break_early()) == [(0, True, False)]
+    assert closed == [True]
+
+
+def test_traced_should_trace_coroutines_and_async_generators():
+    observer = RecordingObserver()
+
+    @observer.traced('asset.process.purchase')
+    async def process(request: dict) -> bool:
+        await asyncio.sleep(0)
+        return observer.active
+
+    @observer.traced('asset.list')
+    async def assets(request: dict):
+        for i in range(2):
+            await asyncio.sleep(0)
+            yield i
+
+    async def _collect():
+        return await process(REQUEST), [i async for i in assets(REQUEST)]
+
+    assert asyncio.run(_collect()) == (True, [0, 1])
+    assert observer.traces == [('asset.process.purchase', REQUEST), ('asset.list', REQUEST)]
+
+
+def test_none_observer_adapter_should_not_wrap_traced_functions():
+    def process(request: dict):
+        """Nothing to do."""
+
+    assert NoneObserverAdapter().traced('asset.process.purchase')(process) is process
+
+
+def test_none_observer_adapter_should_fail_on_decoration_if_the_context_argument_does_not_exist():
+    def process(asset: dict):
+        """Nothing to do."""
+
+    with pytest.raises(ValueError):
+        NoneObserverAdapter().traced('asset.process.purchase')(process)
@@ -3,6 +3,7 @@
 #
 # Copyright (c) 2023 Ingram Micro. All Rights Reserved.
 #
+import json
 
 from opentelemetry.sdk import trace
 from rndi.telemetry.adapters.azure import (
@@ -13,6 +14,8 @@ from rndi.telemetry.adapters.azure import (
     is_background_event_request,
     is_custom_event_request,
     is_product_action_request,
+    provide_span_limits,
+    SpanAttributesCollector,
 )
 
 ASSET_REQUEST = {
@@ -135,6 +138,29 @@ def test_hydrate_span_should_successfully_hydrate_tier_config_request():
     assert span.attributes.get('request_type') == "setup"
 
 
+def test_hydrate_span_should_share_the_repeated_identifiers_between_requests():
+    first, second = SpanAttributesCollector(), SpanAttributesCollector()
+    hydrate_span_with_request_attributes(first, json.loads(json.dumps(ASSET_REQUEST)))
+    hydrate_span_with_request_attributes(second, json.loads(json.dumps(ASSET_REQUEST)))
+
+    for key in ('vendor_id', 'product_id', 'marketplace_id', 'request_status', 'request_type'):
+        assert first.attributes[key] is second.attributes[key]
+
+
+def test_provide_span_limits_should_read_the_limits_from_the_config():
+    limits = provide_span_limits({
+        'TELEMETRY_SPAN_ATTRIBUTE_COUNT_LIMIT': '64',
+        'TELEMETRY_SPAN_ATTRIBUTE_VALUE_LENGTH_LIMIT': '2048',
+        'TELEMETRY_SPAN_EVENT_COUNT_LIMIT': 16,
+        'TELEMETRY_SPAN_LINK_COUNT_LIMIT': 8,
+    })
+
+    assert limits.max_span_attributes == 64
+    assert limits.max_span_attribute_length == 2048
+    assert limits.max_events == 16
+    assert limits.max_links == 8
+
+
 def test_hydrate_span_with_product_action_attributes_should_successfully_hydrate_asset_id():
     tracer_provider = trace.TracerProvider()
     tracer = tracer_provider.get_tracer(__name__)
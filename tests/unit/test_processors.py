@@ -0,0 +1,532 @@
+#
+# This file is part of the Ingram Micro CloudBlue RnD Integration Connectors SDK.
+#
+# Copyright (c) 2023 Ingram Micro. All Rights Reserved.
+#
+import json
+import os
+import signal
+import tempfile
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+from opentelemetry.sdk.trace import SpanLimits, TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import Status, StatusCode
+from rndi.telemetry.processors.budget import fair_length, span_size, SpanBudgetSpanProcessor
+from rndi.telemetry.processors.coalescing import CoalescingSpanProcessor, normalize_sql_statement
+from rndi.telemetry.processors.http import compile_url_templates, HttpAggregatingSpanProcessor, template_url
+from rndi.telemetry.processors.recorder import FlightRecorderSpanProcessor, install_dump_signal_handler
+from rndi.telemetry.processors.sharded import ShardedBatchSpanProcessor
+from rndi.telemetry.stats import ObserverStats
+
+
+def _provide_tracer(processor_factory):
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(processor_factory(SimpleSpanProcessor(exporter)))
+    return provider.get_tracer('test'), exporter
+
+
+def _execute(tracer, statement: str, error: bool = False):
+    with tracer.start_as_current_span('SELECT', attributes={
+        'db.system': 'postgresql',
+        'db.statement': statement,
+    }) as span:
+        if error:
+            span.set_status(Status(StatusCode.ERROR, 'relation does not exist'))
+
+
+def test_normalize_sql_statement_should_replace_literals_and_collapse_value_lists():
+    assert normalize_sql_statement(
+        "SELECT * FROM assets WHERE id = 'AST-1' AND  version > 10",
+    ) == "SELECT * FROM assets WHERE id = ? AND version > ?"
+    assert normalize_sql_statement(
+        "INSERT INTO items (a, b) VALUES (%s, %s), (%s, %s), (%s, %s)",
+    ) == "INSERT INTO items (a, b) VALUES (?)"
+    assert normalize_sql_statement("SELECT * FROM t1 WHERE id IN ($1, $2)") == "SELECT * FROM t1 WHERE id IN (?)"
+
+
+def test_coalescing_processor_should_group_consecutive_statements_under_the_same_parent():
+    tracer, exporter = _provide_tracer(CoalescingSpanProcessor)
+
+    with tracer.start_as_current_span('business-transaction'):
+        for i in range(5):
+            _execute(tracer, f"SELECT * FROM assets WHERE id = {i}", error=i in (2, 3))
+        _execute(tracer, "UPDATE assets SET status = 'active'")
+
+    spans = exporter.get_finished_spans()
+    assert [span.name for span in spans] == ['SELECT', 'SELECT', 'business-transaction']
+
+    summary = spans[0]
+    assert summary.attributes['coalesced.count'] == 5
+    assert summary.attributes['coalesced.key'] == 'SELECT * FROM assets WHERE id = ?'
+    assert summary.attributes['coalesced.errors'] == 2
+    assert summary.attributes['coalesced.first_error'] == 'relation does not exist'
+    assert summary.attributes['coalesced.duration.min_ms'] <= summary.attributes['coalesced.duration.max_ms']
+    assert summary.status.status_code is StatusCode.ERROR
+    assert summary.parent.span_id == spans[2].context.span_id
+
+    assert 'coalesced.count' not in spans[1].attributes
+
+
+def test_coalescing_processor_should_flush_runs_when_a_different_sibling_finishes():
+    tracer, exporter = _provide_tracer(CoalescingSpanProcessor)
+
+    with tracer.start_as_current_span('business-transaction'):
+        _execute(tracer, "SELECT 1")
+        _execute(tracer, "SELECT 2")
+        with tracer.start_as_current_span('technical-transaction'):
+            pass
+        _execute(tracer, "SELECT 3")
+
+    spans = exporter.get_finished_spans()
+    assert [span.name for span in spans] == ['SELECT', 'technical-transaction', 'SELECT', 'business-transaction']
+    assert spans[0].attributes['coalesced.count'] == 2
+
+
+def test_coalescing_processor_should_forward_spans_without_parent_or_key():
+    tracer, exporter = _provide_tracer(CoalescingSpanProcessor)
+
+    _execute(tracer, "SELECT 1")
+    _execute(tracer, "SELECT 1")
+
+    assert len(exporter.get_finished_spans()) == 2
+
+
+def test_coalescing_processor_should_flush_pending_runs_on_force_flush():
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(CoalescingSpanProcessor(SimpleSpanProcessor(exporter), max_pending_runs=1))
+    tracer = provider.get_tracer('test')
+
+    with tracer.start_as_current_span('first'):
+        _execute(tracer, "SELECT 1")
+        with tracer.start_as_current_span('second'):
+            _execute(tracer, "SELECT 2")
+            _execute(tracer, "SELECT 3")
+
+            assert [span.name for span in exporter.get_finished_spans()] == ['SELECT']
+            provider.force_flush()
+            assert exporter.get_finished_spans()[1].attributes['coalesced.count'] == 2
+
+
+def _request(tracer, url: str, status_code: int = 200, duration_ms: int = 10):
+    span = tracer.start_span('GET', attributes={'http.method': 'GET', 'http.url': url}, start_time=0)
+    span.set_attribute('http.status_code', status_code)
+    span.end(end_time=duration_ms * 1000000)
+
+
+def test_template_url_should_replace_identifiers_and_query_values():
+    assert template_url(
+        'https://api.cnct.info/public/v1/requests/PR-1234-5678-9012/notes/42?limit=10&offset=20&and(eq(a,b))',
+    ) == 'https://api.cnct.info/public/v1/requests/{id}/notes/{n}?limit=?&offset=?&and(eq(a,b))'
+    assert template_url(
+        '/files/0b4a0b3e-7a4c-4bba-9a3f-6a3b1c3d2e1f',
+    ) == '/files/{uuid}'
+
+
+def test_http_aggregating_processor_should_aggregate_same_route_calls_and_keep_errors_and_outliers():
+    tracer, exporter = _provide_tracer(lambda delegate: HttpAggregatingSpanProcessor(
+        delegate,
+        outlier_threshold_ms=500,
+        latency_buckets_ms=[100, 50],
+    ))
+
+    with tracer.start_as_current_span('business-transaction'):
+        for offset, duration in enumerate([10, 60, 70, 200]):
+            _request(tracer, f"https://api.cnct.info/public/v1/requests?offset={offset}", duration_ms=duration)
+        _request(tracer, 'https://api.cnct.info/public/v1/requests?offset=4', status_code=500)
+        _request(tracer, 'https://api.cnct.info/public/v1/requests?offset=5', duration_ms=900)
+        _request(tracer, 'https://api.cnct.info/public/v1/requests?offset=6')
+        _request(tracer, 'https://api.cnct.info/public/v1/assets/AS-1234-5678')
+
+    spans = exporter.get_finished_spans()
+    assert len(spans) == 5
+    assert [span.attributes['http.url'][-8:] for span in spans[:2]] == ['offset=4', 'offset=5']
+
+    summary = spans[2]
+    assert summary.attributes['coalesced.key'] == 'GET https://api.cnct.info/public/v1/requests?offset=?'
+    assert summary.attributes['coalesced.count'] == 5
+    assert summary.attributes['coalesced.histogram.bounds_ms'] == [50.0, 100.0]
+    assert summary.attributes['coalesced.histogram.counts'] == [2, 2, 1]
+    assert summary.start_time == 0
+    assert summary.end_time == 200 * 1000000
+
+    assert 'coalesced.count' not in spans[3].attributes
+    assert spans[4].name == 'business-transaction'
+
+
+def test_compile_url_templates_should_match_the_custom_templates_before_the_default_ones():
+    templates = compile_url_templates({r'^SUB-\d+$': '{subscription}', '(': '{invalid}'})
+
+    assert len(templates) == len(compile_url_templates({})) + 1
+    assert template_url('/subscriptions/SUB-1234/items/42', templates) == '/subscriptions/{subscription}/items/{n}'
+
+
+def test_http_aggregating_processor_should_not_fail_on_malformed_status_codes_and_urls():
+    tracer, exporter = _provide_tracer(lambda delegate: HttpAggregatingSpanProcessor(delegate))
+
+    with tracer.start_as_current_span('business-transaction'):
+        _request(tracer, 'https://api.cnct.info/public/v1/requests', status_code='unknown')
+        _request(tracer, 'http://[::1/requests')
+
+    spans = exporter.get_finished_spans()
+    assert [span.name for span in spans] == ['GET', 'GET', 'business-transaction']
+    assert spans[0].attributes['http.status_code'] == 'unknown'
+    assert spans[1].attributes['http.url'] == 'http://[::1/requests'
+
+
+def test_flight_recorder_should_keep_the_last_finished_spans_in_order():
+    recorder = FlightRecorderSpanProcessor(capacity=3, window_seconds=None)
+    provider = TracerProvider()
+    provider.add_span_processor(recorder)
+    tracer = provider.get_tracer('test')
+
+    for i in range(5):
+        with tracer.start_as_current_span(f"span-{i}"):
+            pass
+
+    assert [span.name for span in recorder.snapshot()] == ['span-2', 'span-3', 'span-4']
+
+
+def test_flight_recorder_should_only_dump_spans_inside_the_window(tmp_path):
+    recorder = FlightRecorderSpanProcessor(capacity=3, window_seconds=60, path=str(tmp_path))
+    provider = TracerProvider()
+    provider.add_span_processor(recorder)
+    tracer = provider.get_tracer('test')
+
+    tracer.start_span('old', start_time=0).end(end_time=1)
+    with tracer.start_as_current_span('recent'):
+        pass
+
+    filename = recorder.dump('failure')
+
+    assert filename.endswith('-failure.jsonl')
+    with open(filename) as file:
+        lines = file.readlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0])['name'] == 'recent'
+
+
+def test_flight_recorder_should_push_the_spans_to_the_exporter_without_path():
+    exporter = InMemorySpanExporter()
+    recorder = FlightRecorderSpanProcessor(capacity=3, exporter=exporter)
+
+    assert recorder.dump() is None
+
+    provider = TracerProvider()
+    provider.add_span_processor(recorder)
+    with provider.get_tracer('test').start_as_current_span('recent'):
+        pass
+
+    assert recorder.dump() is None
+    assert [span.name for span in exporter.get_finished_spans()] == ['recent']
+
+
+def test_flight_recorder_should_evict_the_oldest_spans_over_the_byte_budget():
+    recorder = FlightRecorderSpanProcessor(capacity=10, window_seconds=None, max_bytes=250)
+    provider = TracerProvider()
+    provider.add_span_processor(recorder)
+    tracer = provider.get_tracer('test')
+
+    for i in range(5):
+        with tracer.start_as_current_span(f"span-{i}", attributes={'payload': 'x' * 100}):
+            pass
+    assert [span.name for span in recorder.snapshot()] == ['span-3', 'span-4']
+
+    with tracer.start_as_current_span('huge', attributes={'payload': 'x' * 1000}):
+        pass
+    assert [span.name for span in recorder.snapshot()] == ['huge']
+
+
+def test_flight_recorder_should_dump_into_the_temporary_directory_by_default():
+    recorder = FlightRecorderSpanProcessor(capacity=3)
+
+    assert recorder.path == tempfile.gettempdir()
+
+
+def test_flight_recorder_should_debounce_the_background_dumps(tmp_path):
+    recorder = FlightRecorderSpanProcessor(capacity=3, path=str(tmp_path), min_dump_interval_seconds=60)
+    provider = TracerProvider()
+    provider.add_span_processor(recorder)
+    with provider.get_tracer('test').start_as_current_span('recent'):
+        pass
+
+    assert recorder.request_dump('failure')
+    assert not recorder.request_dump('failure')
+    assert recorder.request_dump('manual')
+
+    deadline = time.monotonic() + 5
+    while len(list(tmp_path.iterdir())) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sorted(path.name.rsplit('-', 1)[1] for path in tmp_path.iterdir()) == ['failure.jsonl', 'manual.jsonl']
+
+
+def test_flight_recorder_should_be_dumped_on_signal_and_call_the_previous_handler():
+    recorder = Mock()
+    previous = Mock()
+
+    signal.signal(signal.SIGUSR1, previous)
+    try:
+        assert install_dump_signal_handler(recorder, signal.SIGUSR1)
+        os.kill(os.getpid(), signal.SIGUSR1)
+        time.sleep(0.1)
+    finally:
+        signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+
+    recorder.request_dump.assert_called_once_with('signal')
+    recorder.dump.assert_not_called()
+    assert previous.call_args[0][0] == signal.SIGUSR1
+
+
+def test_flight_recorder_should_not_dump_outside_the_path(tmp_path):
+    recorder = FlightRecorderSpanProcessor(capacity=3, path=str(tmp_path / 'dumps'))
+    os.mkdir(recorder.path)
+    provider = TracerProvider()
+    provider.add_span_processor(recorder)
+    with provider.get_tracer('test').start_as_current_span('span'):
+        pass
+
+    filename = recorder.dump('../outside/x')
+
+    assert os.path.dirname(filename) == recorder.path
+    assert filename.endswith('-.._outside_x.jsonl')
+
+
+def _provide_sharded_tracer(**kwargs):
+    exporter = InMemorySpanExporter()
+    exporter.export = Mock(side_effect=exporter.export)
+    processor = ShardedBatchSpanProcessor(exporter, **kwargs)
+    provider = TracerProvider()
+    provider.add_span_processor(processor)
+    return provider.get_tracer('test'), processor, exporter
+
+
+def test_sharded_processor_should_export_in_batches_on_force_flush():
+    tracer, processor, exporter = _provide_sharded_tracer(
+        max_queue_size=100,
+        max_export_batch_size=4,
+        schedule_delay_millis=60000,
+        shards=2,
+    )
+
+    for i in range(10):
+        with tracer.start_as_current_span(f"span-{i}"):
+            pass
+
+    assert processor.force_flush()
+    assert all(len(call[0][0]) <= 4 for call in exporter.export.call_args_list)
+    assert [span.name for span in exporter.get_finished_spans()] == [f"span-{i}" for i in range(10)]
+
+    processor.shutdown()
+    assert not processor.force_flush()
+
+
+def test_sharded_processor_should_drop_the_oldest_spans_when_full():
+    tracer, processor, exporter = _provide_sharded_tracer(
+        max_queue_size=4,
+        max_export_batch_size=4,
+        schedule_delay_millis=60000,
+        shards=1,
+    )
+
+    # hold the export lock as a slow export in progress would, so nothing is exported until the shutdown.
+    with processor._export_lock:
+        for i in range(6):
+            with tracer.start_as_current_span(f"span-{i}"):
+                pass
+    processor.shutdown()
+
+    assert processor.dropped == 2
+    assert [span.name for span in exporter.get_finished_spans()] == ['span-2', 'span-3', 'span-4', 'span-5']
+
+
+def _slow_exporter(exporter: InMemorySpanExporter, seconds: float):
+    export = exporter.export.side_effect
+
+    def _export(spans):
+        time.sleep(seconds)
+        return export(spans)
+
+    exporter.export.side_effect = _export
+
+
+def test_sharded_processor_should_honour_the_force_flush_timeout():
+    _, processor, exporter = _provide_sharded_tracer(
+        max_queue_size=100,
+        max_export_batch_size=2,
+        schedule_delay_millis=60000,
+        shards=1,
+    )
+    _slow_exporter(exporter, 0.05)
+    source, finished = _provide_tracer(lambda delegate: delegate)
+    for i in range(10):
+        with source.start_as_current_span(f"span-{i}"):
+            pass
+    # queued behind the processor back, so the export thread is not woken up.
+    processor._shards[0].extend(finished.get_finished_spans())
+    processor._queued = 10
+
+    started = time.monotonic()
+    assert not processor.force_flush(timeout_millis=60)
+    assert time.monotonic() - started < 0.2
+    assert 0 < len(exporter.get_finished_spans()) < 10
+    assert processor._queued == 10 - len(exporter.get_finished_spans())
+
+    with processor._export_lock:
+        assert not processor.force_flush(timeout_millis=10)
+
+    assert processor.force_flush()
+    assert len(exporter.get_finished_spans()) == 10
+    processor.shutdown()
+
+
+def test_sharded_processor_should_let_a_single_thread_use_the_whole_queue():
+    tracer, processor, exporter = _provide_sharded_tracer(
+        max_queue_size=512,
+        max_export_batch_size=64,
+        schedule_delay_millis=10,
+        shards=16,
+    )
+    _slow_exporter(exporter, 0.05)
+
+    for _ in range(400):
+        with tracer.start_as_current_span('technical-transaction'):
+            pass
+    processor.shutdown()
+
+    assert processor.dropped == 0
+    assert len(exporter.get_finished_spans()) == 400
+
+
+def test_sharded_processor_should_not_drop_spans_under_a_skewed_load():
+    tracer, processor, exporter = _provide_sharded_tracer(
+        max_queue_size=512,
+        max_export_batch_size=64,
+        schedule_delay_millis=10,
+        shards=4,
+    )
+    _slow_exporter(exporter, 0.05)
+
+    def _work(spans: int):
+        for _ in range(spans):
+            with tracer.start_as_current_span('technical-transaction'):
+                pass
+
+    threads = [threading.Thread(target=_work, args=(spans,)) for spans in (400, 10, 10, 10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    processor.shutdown()
+
+    assert processor.dropped == 0
+    assert len(exporter.get_finished_spans()) == 430
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='fork is not available on this platform')
+def test_sharded_processor_should_restart_the_export_thread_after_a_fork():
+    tracer, processor, exporter = _provide_sharded_tracer(schedule_delay_millis=10)
+
+    pid = os.fork()
+    if pid == 0:
+        with tracer.start_as_current_span('child'):
+            pass
+        deadline = time.monotonic() + 5
+        while not exporter.get_finished_spans() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        os._exit(0 if [span.name for span in exporter.get_finished_spans()] == ['child'] else 1)
+
+    _, status = os.waitpid(pid, 0)
+    processor.shutdown()
+
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+    assert exporter.get_finished_spans() == ()
+
+
+def test_sharded_processor_should_export_the_spans_of_all_threads():
+    tracer, processor, exporter = _provide_sharded_tracer(
+        max_queue_size=4096,
+        max_export_batch_size=64,
+        schedule_delay_millis=10,
+        shards=4,
+    )
+
+    def _work():
+        for _ in range(100):
+            with tracer.start_as_current_span('technical-transaction'):
+                pass
+
+    threads = [threading.Thread(target=_work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    processor.shutdown()
+
+    assert len(exporter.get_finished_spans()) == 800
+    assert all(len(call[0][0]) <= 64 for call in exporter.export.call_args_list)
+
+
+def test_fair_length_should_only_truncate_the_longest_strings():
+    assert fair_length([10, 20, 1000], 2000) is None
+    assert fair_length([10, 20, 1000], 130) == 100
+    assert fair_length([10, 20, 1000], 0) == 0
+
+
+def test_budget_processor_should_truncate_the_largest_values_of_spans_over_budget():
+    stats = ObserverStats(enabled=True)
+    tracer, exporter = _provide_tracer(lambda delegate: SpanBudgetSpanProcessor(delegate, 256, stats))
+
+    with tracer.start_as_current_span('small', attributes={'product_id': 'PRD-000-000-000'}):
+        pass
+    with tracer.start_as_current_span('large', attributes={
+        'product_id': 'PRD-000-000-000',
+        'retries': 3,
+        'payload': 'x' * 10000,
+    }) as span:
+        span.add_event('response', {'body': 'y' * 10000})
+
+    small, large = exporter.get_finished_spans()
+    assert small.attributes['product_id'] == 'PRD-000-000-000'
+    assert span_size(large) <= 256
+    assert large.attributes['product_id'] == 'PRD-000-000-000'
+    assert large.attributes['retries'] == 3
+    assert large.attributes['payload'] == 'x' * len(large.events[0].attributes['body'])
+    assert large.context == span.get_span_context()
+    assert stats.snapshot()['limits.truncated_spans']['count'] == 1
+    assert stats.snapshot()['limits.truncated_values']['count'] == 2
+
+
+def test_budget_processor_should_drop_the_newest_events_when_they_do_not_fit():
+    tracer, exporter = _provide_tracer(lambda delegate: SpanBudgetSpanProcessor(delegate, 128))
+
+    with tracer.start_as_current_span('events') as span:
+        for i in range(20):
+            span.add_event(f"event-{i}", {'index': i})
+
+    span = exporter.get_finished_spans()[0]
+    assert span_size(span) <= 128
+    assert [event.name for event in span.events] == [f"event-{i}" for i in range(len(span.events))]
+
+
+def test_budget_processor_should_count_what_the_span_limits_dropped():
+    stats = ObserverStats(enabled=True)
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider(span_limits=SpanLimits(max_span_attributes=2, max_events=1))
+    provider.add_span_processor(SpanBudgetSpanProcessor(SimpleSpanProcessor(exporter), stats=stats))
+
+    with provider.get_tracer('test').start_as_current_span('limited') as span:
+        span.set_attributes({'a': 1, 'b': 2, 'c': 3, 'd': 4})
+        span.add_event('first')
+        span.add_event('second')
+
+    assert len(exporter.get_finished_spans()) == 1
+    snapshot = stats.snapshot()
+    assert snapshot['limits.dropped_attributes']['count'] == 2
+    assert snapshot['limits.dropped_events']['count'] == 1
+    assert 'limits.dropped_links' not in snapshot
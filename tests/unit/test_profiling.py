@@ -0,0 +1,105 @@
+#
+# This file is part of the Ingram Micro CloudBlue RnD Integration Connectors SDK.
+#
+# Copyright (c) 2023 Ingram Micro. All Rights Reserved.
+#
+import random
+import time
+from unittest.mock import Mock
+
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from rndi.telemetry.processors.budget import SpanBudgetSpanProcessor
+from rndi.telemetry.profiling import (
+    attach_profile,
+    decode_folded_profile,
+    encode_folded_profile,
+    SlowTransactionProfiler,
+)
+
+
+def _large_samples(stacks: int = 200, depth: int = 64):
+    generator = random.Random(42)
+    return {
+        ';'.join(f"module_{generator.randrange(1000)}.py:function_{generator.randrange(1000)}" for _ in range(depth)):
+            stacks - i
+        for i in range(stacks)
+    }
+
+
+def _slow_asset_purchase(seconds: float):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        pass
+
+
+def test_profiler_should_sample_the_stack_of_slow_transactions():
+    profiler = SlowTransactionProfiler(threshold_ms=10, interval_ms=1)
+
+    transaction = profiler.start()
+    _slow_asset_purchase(0.1)
+    samples = profiler.stop(transaction)
+
+    assert sum(samples.values()) > 0
+    assert any(stack.endswith('test_profiling.py:_slow_asset_purchase') for stack in samples)
+
+
+def test_profiler_should_not_sample_fast_transactions():
+    profiler = SlowTransactionProfiler(threshold_ms=1000, interval_ms=1)
+
+    transaction = profiler.start()
+    _slow_asset_purchase(0.01)
+
+    assert profiler.stop(transaction) == {}
+    assert profiler.sample() is None
+
+
+def test_folded_profile_should_be_encoded_and_decoded():
+    samples = {'a.py:main;b.py:process': 10, 'a.py:main;c.py:query': 3}
+
+    assert decode_folded_profile(encode_folded_profile(samples)) == samples
+    assert decode_folded_profile(encode_folded_profile(samples, max_stacks=1)) == {'a.py:main;b.py:process': 10}
+
+
+def test_attach_profile_should_only_attach_profiles_with_samples():
+    span = Mock()
+
+    attach_profile(span, {}, 10)
+    span.set_attributes.assert_not_called()
+
+    attach_profile(span, {'a.py:main': 2}, 10)
+    attributes = span.set_attributes.call_args[0][0]
+    assert attributes['profile.samples'] == 2
+    assert attributes['profile.interval_ms'] == 10
+    assert attributes['profile.truncated_stacks'] == 0
+    assert decode_folded_profile(attributes['profile.folded']) == {'a.py:main': 2}
+
+
+def test_folded_profile_should_drop_the_least_frequent_stacks_to_fit():
+    samples = _large_samples()
+    assert len(encode_folded_profile(samples)) > 8192
+
+    encoded = encode_folded_profile(samples, max_bytes=4096)
+    decoded = decode_folded_profile(encoded)
+
+    assert len(encoded) <= 4096
+    assert 0 < len(decoded) < len(samples)
+    assert min(decoded.values()) > max(count for stack, count in samples.items() if stack not in decoded)
+
+
+def test_attached_profile_should_still_decode_after_the_span_byte_budget():
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SpanBudgetSpanProcessor(SimpleSpanProcessor(exporter), max_bytes=8192))
+    samples = _large_samples()
+
+    with provider.get_tracer('test').start_as_current_span('asset.process', attributes={
+        'http.url': 'https://api.cnct.info/public/v1/assets/AS-1234-5678',
+    }) as span:
+        attach_profile(span, samples, 10)
+
+    attributes = exporter.get_finished_spans()[0].attributes
+    decoded = decode_folded_profile(attributes['profile.folded'])
+    assert len(decoded) + attributes['profile.truncated_stacks'] == len(samples)
+    assert all(samples[stack] == count for stack, count in decoded.items())
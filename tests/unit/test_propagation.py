@@ -0,0 +1,46 @@
+#
+# This file is part of the Ingram Micro CloudBlue RnD Integration Connectors SDK.
+#
+# Copyright (c) 2023 Ingram Micro. All Rights Reserved.
+#
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from rndi.telemetry.propagation import extract_context, find_carrier, inject_context
+
+TRACEPARENT = '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01'
+
+
+def test_find_carrier_should_look_for_the_traceparent_in_the_request_headers_and_metadata():
+    assert find_carrier({'id': 'PR-1234', 'traceparent': TRACEPARENT})['id'] == 'PR-1234'
+    assert find_carrier({'headers': {'Traceparent': TRACEPARENT}}) == {'Traceparent': TRACEPARENT}
+    assert find_carrier({'metadata': {'traceparent': TRACEPARENT}}) == {'traceparent': TRACEPARENT}
+    assert find_carrier({'id': 'PR-1234', 'headers': {'Accept': 'application/json'}}) is None
+
+
+def test_extract_context_should_return_the_remote_span_context():
+    context = extract_context({'TRACEPARENT': TRACEPARENT, 'tracestate': 'vendor=value'})
+
+    span_context = trace.get_current_span(context).get_span_context()
+    assert span_context.trace_id == 0x0af7651916cd43dd8448eb211c80319c
+    assert span_context.span_id == 0xb7ad6b7169203331
+    assert span_context.is_remote
+    assert span_context.trace_state.get('vendor') == 'value'
+
+
+def test_extract_context_should_return_none_on_invalid_carriers():
+    assert extract_context({}) is None
+    assert extract_context({'traceparent': 'invalid'}) is None
+
+
+def test_inject_context_should_inject_the_current_span_in_the_carrier():
+    tracer = TracerProvider().get_tracer('test')
+
+    with tracer.start_as_current_span('business-transaction') as span:
+        carrier = inject_context({})
+
+    span_context = span.get_span_context()
+    assert carrier['traceparent'].startswith(f"00-{span_context.trace_id:032x}-{span_context.span_id:016x}-")
+
+    remote = trace.get_current_span(extract_context(carrier)).get_span_context()
+    assert remote.trace_id == span_context.trace_id
+    assert remote.span_id == span_context.span_id
@@ -6,10 +6,19 @@
 
 from unittest.mock import Mock
 
+from opentelemetry.sdk.trace import sampling, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
 from rndi.telemetry.adapters.azure import (
     DevOpsExtensionAzureInsightsObserverAdapter,
     provide_azure_insights_observer_telemetry_adapter,
+    provide_profile_max_bytes,
+    provide_span_processor,
 )
+from rndi.telemetry.processors.budget import span_size, SpanBudgetSpanProcessor
+from rndi.telemetry.processors.coalescing import CoalescingSpanProcessor
+from rndi.telemetry.processors.http import HttpAggregatingSpanProcessor
+from rndi.telemetry.stats import MeasuredSpanProcessor, ObserverStats
 from rndi.telemetry.adapters.null import NoneObserverAdapter
 from rndi.telemetry.contracts import Observer
 from rndi.telemetry.provider import provide_telemetry_observer
@@ -46,6 +55,17 @@ def test_telemetry_provider_should_be_extended_with_supported_drivers():
     assert isinstance(observer, NoneObserverAdapter)
 
 
+def test_telemetry_provider_should_return_the_stop_event_of_the_stats_reporter():
+    observer = provide_telemetry_observer({
+        'TELEMETRY_SERVICE_NAME': 'test-package',
+        'TELEMETRY_STATS_LOG_INTERVAL_SECONDS': '60',
+    }, Mock())
+
+    assert not observer.stats_reporter.is_set()
+    observer.stats_reporter.set()
+    assert NoneObserverAdapter().stats_reporter is None
+
+
 def test_insights_adapter_provider_should_provide_a_insights_adapter_successfully(mocked_span_exporter):
     adapter = provide_azure_insights_observer_telemetry_adapter({
         'TELEMETRY_SERVICE_NAME': 'test-package',
@@ -55,3 +75,68 @@ def test_insights_adapter_provider_should_provide_a_insights_adapter_successfull
 
     assert isinstance(adapter, Observer)
     assert isinstance(adapter, DevOpsExtensionAzureInsightsObserverAdapter)
+
+
+def test_span_processor_provider_should_apply_the_byte_budget_right_before_the_export():
+    processor = provide_span_processor({
+        'TELEMETRY_PGSQL_COALESCING': 'true',
+        'TELEMETRY_REQUESTS_AGGREGATION': 'true',
+        'TELEMETRY_SPAN_BYTES_LIMIT': '512',
+        'TELEMETRY_STATS': 'true',
+    }, InMemorySpanExporter(), ObserverStats(enabled=True))
+
+    assert isinstance(processor, MeasuredSpanProcessor)
+    assert isinstance(processor.delegate, HttpAggregatingSpanProcessor)
+    assert isinstance(processor.delegate.delegate, CoalescingSpanProcessor)
+    assert isinstance(processor.delegate.delegate.delegate, SpanBudgetSpanProcessor)
+    assert isinstance(processor.delegate.delegate.delegate.delegate, BatchSpanProcessor)
+    processor.shutdown()
+
+
+def test_span_processor_provider_should_trim_the_coalesced_summary_spans():
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider(sampler=sampling.ALWAYS_ON)
+    provider.add_span_processor(provide_span_processor({
+        'TELEMETRY_PGSQL_COALESCING': 'true',
+        'TELEMETRY_SPAN_BYTES_LIMIT': '256',
+    }, exporter, ObserverStats()))
+    tracer = provider.get_tracer('test')
+
+    statement = f"SELECT {', '.join(f'column_{i}' for i in range(100))} FROM assets WHERE id = 1"
+    with tracer.start_as_current_span('business-transaction'):
+        for _ in range(3):
+            with tracer.start_as_current_span('SELECT', attributes={
+                'db.system': 'postgresql',
+                'db.statement': statement,
+            }):
+                pass
+    provider.force_flush()
+
+    summary = exporter.get_finished_spans()[0]
+    assert summary.attributes['coalesced.count'] == 3
+    assert span_size(summary) <= 256
+    provider.shutdown()
+
+
+def test_span_processor_provider_should_read_the_requests_templates_and_latency_buckets():
+    processor = provide_span_processor({
+        'TELEMETRY_REQUESTS_AGGREGATION': 'true',
+        'TELEMETRY_REQUESTS_URL_TEMPLATES': '{"^SUB-\\\\d+$": "{subscription}"}',
+        'TELEMETRY_REQUESTS_LATENCY_BUCKETS_MS': '250, 50',
+    }, InMemorySpanExporter(), ObserverStats())
+
+    aggregating = processor
+    assert aggregating.latency_buckets_ms == (50.0, 250.0)
+    assert aggregating.templates[0][1] == '{subscription}'
+    assert aggregating.templates[0][0].match('SUB-1234')
+    processor.shutdown()
+
+
+def test_profile_max_bytes_provider_should_fit_the_profile_in_the_span_limits():
+    assert provide_profile_max_bytes({}) == 4096
+    assert provide_profile_max_bytes({'TELEMETRY_PROFILER_MAX_BYTES': '6000'}) == 6000
+    assert provide_profile_max_bytes({
+        'TELEMETRY_PROFILER_MAX_BYTES': '6000',
+        'TELEMETRY_SPAN_ATTRIBUTE_VALUE_LENGTH_LIMIT': '5000',
+        'TELEMETRY_SPAN_BYTES_LIMIT': '4000',
+    }) == 2000
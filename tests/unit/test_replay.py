@@ -0,0 +1,111 @@
+#
+# This file is part of the Ingram Micro CloudBlue RnD Integration Connectors SDK.
+#
+# Copyright (c) 2023 Ingram Micro. All Rights Reserved.
+#
+import io
+import json
+from unittest.mock import Mock
+
+import pytest
+from rndi.telemetry.adapters.azure import DevOpsExtensionAzureInsightsObserverAdapter
+from rndi.telemetry.replay import (
+    LatencyHistogram,
+    main,
+    NullSpanExporter,
+    provide_replay_observer,
+    read_corpus,
+    replay_with_threads,
+)
+from tests.unit.test_helpers import ASSET_REQUEST, TIER_CONFIG_REQUEST
+
+CORPUS = [
+    ASSET_REQUEST,
+    TIER_CONFIG_REQUEST,
+    {'jwt_payload': {'asset_id': 'AST-0000-0000-0000-001'}},
+    {'body': {'first-key': 'first-value'}},
+]
+
+
+def test_read_corpus_should_stream_the_requests_skipping_blank_lines():
+    corpus = io.StringIO('\n'.join(json.dumps(request) for request in CORPUS) + '\n\n')
+
+    assert list(read_corpus(corpus)) == CORPUS
+    assert list(read_corpus(io.StringIO('{"id": 1}\n\n{"id": 2}\n{"id": 3}\n'), limit=2)) == [{'id': 1}, {'id': 2}]
+
+
+def test_read_corpus_should_skip_and_count_the_malformed_lines():
+    skipped = []
+    corpus = io.StringIO('{"id": 1}\n{"id": 2, "asset": {\n[1, 2]\n{"id": 3}\n')
+
+    assert list(read_corpus(corpus, on_skipped=skipped.append)) == [{'id': 1}, {'id': 3}]
+    assert skipped == [2, 3]
+
+
+def test_latency_histogram_should_compute_percentiles():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(50) == 0.0
+
+    for nanoseconds in range(1, 1001):
+        histogram.add(nanoseconds * 1000)
+    other = LatencyHistogram()
+    other.add(10000000)
+    histogram.merge(other)
+
+    assert histogram.count == 1001
+    assert 500000 <= histogram.percentile(50) <= 500000 * 1.05
+    assert 990000 <= histogram.percentile(99) <= 990000 * 1.05
+    assert histogram.percentile(100) >= 10000000
+
+
+def test_replay_with_threads_should_trace_every_request_as_a_business_transaction():
+    observer = provide_replay_observer({}, NullSpanExporter())
+    assert isinstance(observer, DevOpsExtensionAzureInsightsObserverAdapter)
+
+    histogram = replay_with_threads(observer, iter(CORPUS * 10), concurrency=4)
+
+    assert histogram.count == 40
+    assert observer.business_transaction is None
+
+
+def test_replay_with_threads_should_not_hang_if_the_requests_fail():
+    def _requests():
+        yield ASSET_REQUEST
+        raise OSError('Input/output error')
+
+    observer = provide_replay_observer({}, NullSpanExporter())
+
+    with pytest.raises(OSError):
+        replay_with_threads(observer, _requests(), concurrency=2)
+
+
+def test_replay_with_threads_should_raise_the_errors_of_the_workers():
+    observer = Mock()
+    observer.trace.side_effect = RuntimeError('broken observer')
+
+    with pytest.raises(RuntimeError):
+        replay_with_threads(observer, iter(CORPUS * 100), concurrency=2)
+
+
+def test_replay_main_should_reject_a_concurrency_below_one(tmp_path, capsys):
+    corpus = tmp_path / 'corpus.jsonl'
+    corpus.write_text(json.dumps(CORPUS[0]))
+
+    with pytest.raises(SystemExit):
+        main([str(corpus), '--concurrency', '0'])
+
+    assert '0 is not greater than 0' in capsys.readouterr().err
+
+
+def test_replay_main_should_report_throughput_overhead_and_memory(tmp_path, capsys):
+    corpus = tmp_path / 'corpus.jsonl'
+    corpus.write_text('\n'.join(json.dumps(request) for request in CORPUS) + '\n{"id": "PR-\n')
+
+    assert main([str(corpus), '--concurrency', '2', '--exporter', 'memory', '--tracemalloc']) == 0
+
+    output = capsys.readouterr().out
+    assert 'requests          4' in output
+    assert 'skipped lines     1' in output
+    assert 'requests/sec' in output
+    assert 'p99 overhead' in output
+    assert 'observer_allocated_blocks' in output
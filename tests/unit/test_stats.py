@@ -0,0 +1,101 @@
+#
+# This file is part of the Ingram Micro CloudBlue RnD Integration Connectors SDK.
+#
+# Copyright (c) 2023 Ingram Micro. All Rights Reserved.
+#
+import threading
+import time
+from unittest.mock import Mock
+
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from rndi.telemetry.stats import MeasuredSpanProcessor, NONE_TIMER, ObserverStats, start_stats_reporter
+
+
+def test_observer_stats_should_do_nothing_when_disabled():
+    stats = ObserverStats()
+
+    with stats.timed('classification') as timer:
+        assert timer is NONE_TIMER
+    stats.record('classification', 10)
+
+    assert stats.snapshot() == {}
+
+
+def test_observer_stats_should_count_the_time_spent_by_name():
+    stats = ObserverStats(enabled=True)
+
+    with stats.timed('hydration'):
+        pass
+    stats.record('hydration', 3000000)
+    stats.record('hydration', 1000000)
+
+    snapshot = stats.snapshot()
+    assert snapshot['hydration']['count'] == 3
+    assert snapshot['hydration']['total_ms'] >= 4
+    assert snapshot['hydration']['max_ms'] == 3
+
+    stats.reset()
+    assert stats.snapshot() == {}
+
+
+def test_observer_stats_should_add_to_the_counters_without_time():
+    stats = ObserverStats(enabled=True)
+
+    stats.add('limits.truncated_spans')
+    stats.add('limits.truncated_spans', 2)
+
+    assert stats.snapshot() == {'limits.truncated_spans': {'count': 3, 'total_ms': 0, 'max_ms': 0}}
+
+
+def test_observer_stats_should_merge_the_counters_of_every_thread():
+    stats = ObserverStats(enabled=True)
+
+    def _work():
+        for _ in range(1000):
+            stats.record('span.start', 1000000)
+            stats.add('limits.truncated_spans')
+
+    threads = [threading.Thread(target=_work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    stats.record('span.start', 5000000)
+    for thread in threads:
+        thread.join()
+
+    snapshot = stats.snapshot()
+    assert snapshot['span.start']['count'] == 8001
+    assert snapshot['span.start']['total_ms'] == 8005
+    assert snapshot['span.start']['max_ms'] == 5
+    assert snapshot['limits.truncated_spans']['count'] == 8000
+    assert len(stats._shards) == 9
+
+    stats.reset()
+    assert stats.snapshot() == {}
+
+
+def test_measured_span_processor_should_measure_the_delegated_processor():
+    stats = ObserverStats(enabled=True)
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(MeasuredSpanProcessor(SimpleSpanProcessor(exporter), stats))
+
+    with provider.get_tracer('test').start_as_current_span('span'):
+        pass
+    provider.force_flush()
+    provider.shutdown()
+
+    assert len(exporter.get_finished_spans()) == 1
+    assert stats.snapshot()['processor.on_start']['count'] == 1
+    assert stats.snapshot()['processor.on_end']['count'] == 1
+
+
+def test_stats_reporter_should_log_the_stats_periodically():
+    logger = Mock()
+
+    stop = start_stats_reporter(lambda: {'span.start': {'count': 1}}, logger, 0.01)
+    time.sleep(0.1)
+    stop.set()
+
+    logger.info.assert_called_with("Telemetry Observer stats: {'span.start': {'count': 1}}")